@@ -0,0 +1,111 @@
+# -------------------------------------------------------------------------------
+# Name:        Anytime mode of the O^2 Challenge column generation
+#
+# With a deadline run() gets one budget of wall clock seconds for the whole
+# run instead of an iteration cap and a separate time limit of the MIP. The
+# Deadline stops the pricing once the next iteration, as long as the longest
+# one so far, would eat into the time kept for the MIP, and the MIP gets
+# whatever is left but the time to check and write its solution, as long as
+# that took for the solutions before, and a margin. All along the Incumbent holds the best solution the
+# verifier accepted: the single ride duties at first, then a rounding of every
+# LP solution, then the MIP. It is written to the output file every time it
+# improves, so a run that is cut short still leaves a valid schedule behind.
+# -------------------------------------------------------------------------------
+
+import os
+import tempfile
+import time
+import numpy as np
+from o2_verifier import verify
+
+
+class Deadline(object):
+    """seconds of wall clock time from now for the column generation and the MIP together.
+
+    mip_share: part of the budget kept for the MIP. margin: part of the budget, and at least min_margin seconds,
+    left over after the MIP and the work after it, for a MIP that goes over its time limit.
+    """
+
+    def __init__(self, seconds, mip_share=0.25, margin=0.02, min_margin=0.5):
+        self.seconds = seconds
+        self.mip_share = mip_share
+        self.margin = margin
+        self.min_margin = min_margin
+        self.started = time.time()
+        self.lap_started = None
+        self.longest = 0.0  # seconds of the longest iteration so far
+
+    def remaining(self):
+        return self.seconds - (time.time() - self.started)
+
+    def lap(self):
+        # called at the start of every iteration, the first call only starts the clock of the iterations
+        now = time.time()
+        if self.lap_started is not None:
+            self.longest = max(self.longest, now - self.lap_started)
+        self.lap_started = now
+
+    def stop_pricing(self):
+        """True when one more iteration would not leave the MIP its share of the budget."""
+        return self.remaining() - self.longest < self.mip_share * self.seconds
+
+    def mip_seconds(self, after=0.0):
+        """Seconds left for the MIP when the work after it takes after seconds."""
+        return max(self.remaining() - after - max(self.margin * self.seconds, self.min_margin), 0.0)
+
+
+def round_duties(num_rows, columns, x, tolerance=1e-6):
+    """A partition of the rides from a fractional solution x of the master.
+
+    Columns are taken by decreasing value as long as they share no ride with the ones taken before, every ride
+    left over is a duty of its own with id len(columns) + ride. Returns the duty of every ride, like ride_duties.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    duty = np.full(num_rows, -1, dtype=np.int64)
+    for i in np.argsort(-x, kind="mergesort").tolist():
+        if x[i] <= tolerance:
+            break
+        column = columns[i]
+        if (duty[column] < 0).all():
+            duty[column] = i
+    free = np.flatnonzero(duty < 0)
+    duty[free] = len(columns) + free
+    return duty
+
+
+class Incumbent(object):
+    """The best solution the verifier accepted so far, kept in output_file."""
+
+    def __init__(self, trips, output_file, max_changeovers):
+        self.trips = trips
+        self.output_file = output_file
+        self.max_changeovers = max_changeovers
+        self.duty = None
+        self.value = float("inf")  # number of duties
+        self.source = None
+        self.rejected = 0  # solutions with fewer duties that failed the verifier
+        self.offer_seconds = 0.0  # longest check and write of a solution so far
+
+    def offer(self, duty, source):
+        """Keep duty (the duty of every ride) if it has fewer duties than the incumbent and passes the verifier."""
+        value = len(np.unique(duty))
+        if value >= self.value:
+            return False
+        started = time.time()
+        try:
+            if not verify(self.trips, duty, self.max_changeovers)["acceptable"]:
+                self.rejected += 1
+                return False
+            self.duty, self.value, self.source = np.asarray(duty, dtype=np.int64), value, source
+            self.write()
+            return True
+        finally:
+            self.offer_seconds = max(self.offer_seconds, time.time() - started)
+
+    def write(self):
+        # written next to output_file and renamed, a run killed half way leaves the previous incumbent in place
+        directory = os.path.dirname(os.path.abspath(self.output_file))
+        handle, partial = tempfile.mkstemp(dir=directory, suffix=".csv")
+        with os.fdopen(handle, "w") as f:
+            f.writelines("{0}\n".format(d) for d in self.duty.tolist())
+        os.rename(partial, self.output_file)
@@ -0,0 +1,309 @@
+# -------------------------------------------------------------------------------
+# Name:        Synthetic timetables and phase benchmarks for the O^2 Challenge
+#
+# generate_timetable writes random bus blocks in the 9 column input format:
+# every bus pulls out of the depot, shuttles between the central terminal and
+# the two relief stops of its route, and pulls in again, some of them after
+# midnight. run_benchmark solves onecar / twocars, or o2_engine with more
+# vehicle switches, on timetables of growing size and writes one JSON line per
+# run with the seconds spent in every phase (parse, pricing, master LP
+# re-solves, final MIP and the verifier). The per-iteration telemetry of every
+# run is kept next to its solution.
+#
+# With --check it compares the pricers instead: the full and the incremental
+# Pricer and the ParallelPricer must find the same labels and shifts over a
+# series of dual updates, and best_value must agree with trying every duty.
+#
+# Usage: python o2_bench.py --scales 1 10 100 --models onecar twocars --out bench.jsonl
+#        python o2_bench.py --check --scales 1 --max-switches 2 --changeover-window 0 5
+# -------------------------------------------------------------------------------
+
+import argparse
+import importlib
+import json
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.join(HERE, "onecar"), os.path.join(HERE, "twocars")]
+
+import numpy as np
+from o2_engine import O2Parser
+from o2_ingest import read_trips
+from o2_pricing import MAX_DUTY_TIME, MAX_TIME_WITHOUT_BREAK, MIN_BREAK_TIME, Pricer, ParallelPricer
+from o2_telemetry import Telemetry
+from o2_verifier import MAX_CHANGEOVERS, read_solution, verify
+from o2_worker import call_logged
+
+HEADER = "Duty id,Vehicle Id,Event Type,Departure Time,Arrival Time,Origin Stop Id,Origin Stop Name," \
+         "Destination Stop Id,Destination Stop Name"
+DEPOT = 99999
+TERMINAL = 1
+FIRST_RELIEF_STOP = 100
+
+# scale 1 of the benchmark is the size of large_data_csv.csv: 38 blocks from pull out to pull in with about 23
+# service trips each, and 11 relief stops besides the depot and the terminal. The file runs the blocks on 36
+# vehicles (two of them pull out twice), the generator gives every block a vehicle of its own
+BASE_BUSES = 38
+BASE_TRIPS_PER_BLOCK = 23
+BASE_RELIEF_STOPS = 11
+
+# the labels of the pricers, see o2_pricing
+LABELS = ["S_end_time", "S_time_of_beginning_of_break", "S_price", "S_neighbor"]
+
+
+def stop_name(stop):
+    if stop == DEPOT:
+        return "Depot"
+    if stop == TERMINAL:
+        return "Central Terminal"
+    return "Relief Stop {0}".format(stop)
+
+
+def format_time(minutes):
+    # hours of 24 and above are service after midnight
+    return "{0:02d}:{1:02d}:00".format(minutes // 60, minutes % 60)
+
+
+def generate_timetable(filename, num_buses=BASE_BUSES, trips_per_block=BASE_TRIPS_PER_BLOCK,
+                       num_relief_stops=BASE_RELIEF_STOPS, after_midnight=0.3, seed=0):
+    """Write a random timetable of num_buses blocks, returns the number of rides.
+
+    Every block has trips_per_block service trips between the terminal and two of the
+    num_relief_stops relief stops, a fraction after_midnight of the blocks runs past 24:00.
+    """
+    rng = random.Random(seed)
+    relief_stops = list(range(FIRST_RELIEF_STOP, FIRST_RELIEF_STOP + max(num_relief_stops, 2)))
+    rows = []
+    for bus in range(num_buses):
+        vehicle = "{0}-{1}".format(bus % 9 + 1, 101 + bus)
+        route = rng.sample(relief_stops, 2)
+        run_time = [5 * rng.randint(3, 8) for _ in route]  # minutes from the terminal to every relief stop
+
+        # stops in visiting order: relief stop, terminal, other relief stop, terminal, ...
+        stops = [route[0]]
+        for k in range(trips_per_block):
+            stops.append(TERMINAL if k % 2 == 0 else route[(k // 2 + 1) % 2])
+        legs = [run_time[route.index(stop if stop != TERMINAL else previous)]
+                for previous, stop in zip(stops[:-1], stops[1:])]
+        layovers = [5 * (rng.random() < 0.2) for _ in legs]
+        pull_out, pull_in = 5 * rng.randint(2, 6), 5 * rng.randint(1, 3)
+        length = pull_out + sum(legs) + sum(layovers) + pull_in
+
+        if rng.random() < after_midnight:
+            end = 24 * 60 + 5 * rng.randint(0, 24)
+            start = max(end - length, 4 * 60)
+        else:
+            start = 5 * rng.randint(4 * 60 // 5 + 6, max(23 * 60 + 55 - length, 4 * 60 + 30) // 5)
+
+        time_now = start
+        rows.append((time_now, vehicle, "depot_pull_out", time_now + pull_out, DEPOT, stops[0]))
+        time_now += pull_out
+        for previous, stop, leg, layover in zip(stops[:-1], stops[1:], legs, layovers):
+            time_now += layover
+            rows.append((time_now, vehicle, "service_trip", time_now + leg, previous, stop))
+            time_now += leg
+        rows.append((time_now, vehicle, "depot_pull_in", time_now + pull_in, stops[-1], DEPOT))
+
+    # the published file is roughly in order of departure, not grouped by bus
+    rows.sort(key=lambda row: (row[0], row[1]))
+    with open(filename, "w") as f:
+        f.write(HEADER + "\n")
+        for departure, vehicle, event, arrival, origin, destination in rows:
+            f.write(",{0},{1},{2},{3},{4},{5},{6},{7}\n".format(
+                vehicle, event, format_time(departure), format_time(arrival), origin, stop_name(origin),
+                destination, stop_name(destination)))
+    return len(rows)
+
+
+def check_solution(input_file, output_file, max_changeovers=MAX_CHANGEOVERS):
+    # returns (seconds, acceptable), the seconds include reading both files like a run of the verifier script
+    started = time.time()
+    result = verify(read_trips(input_file), read_solution(output_file), max_changeovers)
+    return time.time() - started, result["acceptable"]
+
+
+def run_benchmark(model, input_file, work_dir, max_num_of_iter, max_seconds_of_final, quiet=True, **kwargs):
+    """Solve input_file with model (onecar, twocars or o2_engine) inside work_dir.
+
+    Returns a dict of statistics and phase timings, or of the error when the run failed.
+    """
+    module = importlib.import_module(model)
+    input_file = os.path.abspath(input_file)
+    output_file_name = os.path.join(os.path.abspath(work_dir), "{0}_{1}".format(
+        model, os.path.splitext(os.path.basename(input_file))[0]))
+    telemetry_file = output_file_name + "_telemetry.jsonl"
+
+    # run writes its lp files to the current directory
+    started = time.time()
+    stats, error = call_logged(os.devnull if quiet else None, work_dir, module.run, max_num_of_iter,
+                               max_seconds_of_final, input_file, output_file_name,
+                               telemetry=Telemetry(telemetry_file), **kwargs)
+    stats_time = time.time() - started
+    if error is not None:
+        # the other models and timetables go on
+        return {"error": error, "verified": False, "timings": {"total": stats_time}, "model": model,
+                "input_file": input_file, "telemetry_file": telemetry_file}
+
+    stats["timings"]["total"] = stats_time
+    stats["timings"]["verify"], stats["verified"] = check_solution(
+        input_file, stats["output_file"], max(MAX_CHANGEOVERS, kwargs.get("max_switches", 0)))
+    stats["model"] = model
+    stats["input_file"] = input_file
+    stats["telemetry_file"] = telemetry_file  # the iterations of the run
+    return stats
+
+
+def brute_best_value(trips, successors, changeovers, max_switches, terminal, y):
+    # value of the best duty for the duals y by trying every duty, only for small timetables
+    start_time, end_time = trips.start_time.tolist(), trips.end_time.tolist()
+    best = -float("inf")
+    for first in range(len(trips)):
+        # (ride, switches so far, start of the part since the last break, value)
+        stack = [(first, 0, start_time[first], y[first])]
+        while stack:
+            ride, switches, part_start, value = stack.pop()
+            best = max(best, value)
+            if terminal[ride]:
+                continue
+            steps = [(int(r), switches) for r in successors[ride]]
+            if switches < max_switches:
+                steps += [(int(r), switches + 1) for r in changeovers[ride]]
+            for next_ride, next_switches in steps:
+                if end_time[next_ride] - start_time[first] > MAX_DUTY_TIME:
+                    continue
+                if start_time[next_ride] - end_time[ride] >= MIN_BREAK_TIME:
+                    stack.append((next_ride, next_switches, start_time[next_ride], value + y[next_ride]))
+                elif end_time[next_ride] - part_start < MAX_TIME_WITHOUT_BREAK:
+                    stack.append((next_ride, next_switches, part_start, value + y[next_ride]))
+    return best
+
+
+def check_pricing(input_file, max_switches, changeover_window=(0, 0), updates=100, brute_every=10, processes=2,
+                  seed=0):
+    """Compare the pricers on input_file over updates random dual updates, returns the differences found.
+
+    Like the duals of the master, most duals stay and the ones of a few buses move at every update. The full and
+    the incremental Pricer and the ParallelPricer must have the same labels and shifts, best_value must not be
+    below the value of the pricing and, every brute_every updates, must be the value of trying every duty.
+    """
+    trips, successors, changeovers, bus_to_nodes = O2Parser.pars(input_file, max_switches, changeover_window)
+    pricers = [("full", Pricer(trips, successors, bus_to_nodes, changeovers, max_switches, incremental=False)),
+               ("incremental", Pricer(trips, successors, bus_to_nodes, changeovers, max_switches)),
+               ("parallel", ParallelPricer(trips, successors, bus_to_nodes, processes, changeovers, max_switches))]
+    reference = pricers[0][1]
+    rng = np.random.RandomState(seed)
+    num_buses = len(trips.bus_names)
+    y = rng.uniform(0, 1, len(trips))
+    problems = []
+    try:
+        for update in range(updates):
+            if update:
+                moved = np.isin(trips.bus, rng.choice(num_buses, max(num_buses // 10, 1), replace=False))
+                y = y.copy()
+                y[moved] = rng.uniform(-0.2, 1, moved.sum()) * (rng.rand(moved.sum()) < 0.6)
+            shifts = [pricer.get_shifts(y, 5) for _, pricer in pricers]
+            for (name, pricer), result in zip(pricers[1:], shifts[1:]):
+                for label in LABELS:
+                    if not np.array_equal(getattr(pricer, label), getattr(reference, label)):
+                        problems.append("update {0}: {1} of the {2} pricer differs".format(update, label, name))
+                if result["paths"] != shifts[0]["paths"]:
+                    problems.append("update {0}: the {1} pricer found other shifts".format(update, name))
+
+            best = reference.best_value(y)
+            if best < shifts[0]["max_value"] - 1e-9:
+                problems.append("update {0}: best_value {1} below the pricing {2}".format(
+                    update, best, shifts[0]["max_value"]))
+            if brute_every and update % brute_every == 0:
+                brute = brute_best_value(trips, successors, changeovers, max_switches, reference.terminal, y)
+                if abs(best - brute) > 1e-9:
+                    problems.append("update {0}: best_value {1}, trying every duty {2}".format(update, best, brute))
+    finally:
+        for _, pricer in pricers:
+            pricer.close()
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Phase level benchmarks on synthetic timetables.")
+    parser.add_argument("--models", nargs="+", default=["onecar", "twocars"],
+                        choices=["onecar", "twocars", "o2_engine"])
+    parser.add_argument("--scales", nargs="+", type=float, default=[1, 10, 100],
+                        help="timetable sizes relative to large_data_csv.csv (number of buses and relief stops)")
+    parser.add_argument("--trips-per-block", type=int, default=BASE_TRIPS_PER_BLOCK)
+    parser.add_argument("--relief-stops", type=int, default=BASE_RELIEF_STOPS, help="relief stops at scale 1")
+    parser.add_argument("--after-midnight", type=float, default=0.3, help="fraction of blocks that end after 24:00")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-iter", type=int, default=1000)
+    parser.add_argument("--max-seconds-of-final", type=int, default=300)
+    parser.add_argument("--columns-per-iter", type=int, default=1)
+    parser.add_argument("--pricing-processes", type=int, default=1)
+    parser.add_argument("--dual-smoothing", type=float, default=0.0)
+    parser.add_argument("--master-backend", default="cplex")
+    parser.add_argument("--max-column-age", type=int, default=0)
+    parser.add_argument("--gap-tolerance", type=float, default=None)
+    parser.add_argument("--integer-gap", type=int, default=None)
+    parser.add_argument("--tailing-off", nargs=2, type=float, default=None, metavar=("ITERATIONS", "IMPROVEMENT"))
+    parser.add_argument("--deadline", type=float, default=None, help="seconds for the whole run, see o2_anytime")
+    parser.add_argument("--warm-start", type=int, default=None, help="randomized variants of the initial duties")
+    parser.add_argument("--changeover-window", nargs=2, type=int, default=[0, 0], help="twocars and o2_engine")
+    parser.add_argument("--max-switches", type=int, default=2, help="vehicle switches per duty, o2_engine only")
+    parser.add_argument("--work-dir", default="bench", help="timetables, solutions and lp files go here")
+    parser.add_argument("--out", default=None, help="append the JSON lines to this file instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the solver")
+    parser.add_argument("--check", action="store_true",
+                        help="compare the pricers for 0 to --max-switches switches instead of timing the models")
+    parser.add_argument("--check-updates", type=int, default=100, help="dual updates of every --check")
+    args = parser.parse_args(argv)
+    if args.changeover_window[0] < 0:
+        parser.error("--changeover-window: the minimum wait must be >= 0")
+
+    if not os.path.isdir(args.work_dir):
+        os.makedirs(args.work_dir)
+    out = open(args.out, "a") if args.out else sys.stdout
+
+    failed = False
+    for scale in args.scales:
+        num_buses = max(int(round(BASE_BUSES * scale)), 1)
+        input_file = os.path.join(args.work_dir, "timetable_x{0:g}_seed{1}.csv".format(scale, args.seed))
+        generate_timetable(input_file, num_buses, args.trips_per_block, max(int(round(args.relief_stops * scale)), 2),
+                           args.after_midnight, args.seed)
+
+        if args.check:
+            for max_switches in range(args.max_switches + 1):
+                problems = check_pricing(input_file, max_switches, tuple(args.changeover_window), args.check_updates,
+                                         processes=max(args.pricing_processes, 2), seed=args.seed)
+                print("scale {0:g}, {1} switches: {2}".format(
+                    scale, max_switches, "{0} problems".format(len(problems)) if problems else "ok"))
+                for problem in problems[:10]:
+                    print("  " + problem)
+                failed = failed or bool(problems)
+            continue
+
+        for model in args.models:
+            kwargs = {"columns_per_iter": args.columns_per_iter, "pricing_processes": args.pricing_processes,
+                      "dual_smoothing": args.dual_smoothing, "master_backend": args.master_backend,
+                      "max_column_age": args.max_column_age, "gap_tolerance": args.gap_tolerance,
+                      "integer_gap": args.integer_gap, "deadline": args.deadline, "warm_start": args.warm_start,
+                      "tailing_off": (int(args.tailing_off[0]), args.tailing_off[1]) if args.tailing_off else None}
+            if model != "onecar":
+                kwargs["changeover_window"] = tuple(args.changeover_window)
+            if model == "o2_engine":
+                kwargs["max_switches"] = args.max_switches
+            stats = run_benchmark(model, input_file, args.work_dir, args.max_iter, args.max_seconds_of_final,
+                                  not args.verbose, **kwargs)
+            stats.update({"scale": scale, "buses": num_buses, "seed": args.seed, "options": kwargs})
+            failed = failed or "error" in stats
+            out.write(json.dumps(stats, sort_keys=True) + "\n")
+            out.flush()
+
+    if args.out:
+        out.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -------------------------------------------------------------------------------
+# Name:        On-disk cache of parsed O^2 Challenge timetables
+#
+# The output of O2Parser.pars (trip arrays, successor indexes and bus blocks) is
+# kept as .npy files in cache_dir/<key>/, where the key hashes the content of
+# the input file together with the parser version and its arguments. Later runs
+# on the same file memory-map the arrays instead of parsing again.
+# -------------------------------------------------------------------------------
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from o2_timetable import TripTable, Successors
+
+TRIP_ARRAYS = ["bus", "event", "start_time", "end_time", "start_location", "end_location"]
+SUCCESSOR_ARRAYS = ["indptr", "indices", "changeover_indptr", "changeover_indices"]
+
+
+def cache_key(filename, tag):
+    # sha1 of the file content and of tag, which names the parser version and arguments
+    digest = hashlib.sha1(tag.encode("utf-8"))
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load(directory):
+    # None if there is no complete entry in directory
+    if not os.path.isfile(os.path.join(directory, "meta.json")):
+        return None
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = dict((name, np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+                  for name in TRIP_ARRAYS + SUCCESSOR_ARRAYS + ["block_ptr", "block_nodes"])
+
+    trips = TripTable(*[arrays[name] for name in TRIP_ARRAYS], bus_names=meta["bus_names"])
+    successors = Successors(arrays["indptr"], arrays["indices"])
+    changeovers = Successors(arrays["changeover_indptr"], arrays["changeover_indices"])
+    block_ptr, block_nodes = arrays["block_ptr"], arrays["block_nodes"]
+    bus_to_nodes = OrderedDict((name, block_nodes[block_ptr[k]:block_ptr[k + 1]].tolist())
+                               for k, name in enumerate(meta["blocks"]))
+    return trips, successors, changeovers, bus_to_nodes
+
+
+def save(directory, trips, successors, changeovers, bus_to_nodes):
+    # written next to directory and renamed, so a run that stops half way leaves no entry behind
+    parent = os.path.dirname(os.path.abspath(directory))
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    partial = tempfile.mkdtemp(dir=parent)
+
+    arrays = dict((name, getattr(trips, name)) for name in TRIP_ARRAYS)
+    arrays["indptr"], arrays["indices"] = successors.indptr, successors.indices
+    arrays["changeover_indptr"], arrays["changeover_indices"] = changeovers.indptr, changeovers.indices
+    arrays["block_ptr"] = np.cumsum([0] + [len(nodes) for nodes in bus_to_nodes.values()]).astype(np.int64)
+    arrays["block_nodes"] = np.array([u for nodes in bus_to_nodes.values() for u in nodes], dtype=np.int64)
+    for name, array in arrays.items():
+        np.save(os.path.join(partial, name + ".npy"), np.ascontiguousarray(array))
+    with open(os.path.join(partial, "meta.json"), "w") as f:
+        json.dump({"bus_names": list(trips.bus_names), "blocks": list(bus_to_nodes)}, f)
+
+    try:
+        os.rename(partial, directory)
+    except OSError:
+        shutil.rmtree(partial)  # another run saved it first
+
+
+def cached_pars(cache_dir, filename, tag, pars):
+    """The output of pars() for filename, from cache_dir when this file was parsed with the same tag before."""
+    directory = os.path.join(cache_dir, cache_key(filename, tag))
+    result = load(directory)
+    if result is None:
+        result = pars()
+        save(directory, *result)
+    return result
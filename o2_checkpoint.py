@@ -0,0 +1,100 @@
+# -------------------------------------------------------------------------------
+# Name:        Checkpoints of the O^2 Challenge column generation
+#
+# A checkpoint holds everything the main loop of run() needs to go on: the
+# columns of the master with their pool state (ages, removed columns), the
+# duals of the last LP solve, the stability center of the dual smoothing, the
+# history of the stopping rules and the iteration counter. It is one .npz file,
+# written next to its final name and renamed, so an interrupted save leaves the
+# previous checkpoint in place. The key of the checkpoint hashes the input file
+# and the parser, a checkpoint is never resumed on another timetable.
+#
+# On resume the master LP is solved from scratch. The first pricing round uses
+# the saved duals, but a degenerate master may give other duals after that, so
+# the rest of the run can differ from the one that was interrupted.
+# -------------------------------------------------------------------------------
+
+import json
+import os
+import tempfile
+import numpy as np
+from o2_column_pool import reduced_costs
+
+FORMAT = 2
+
+
+def _flat(columns):
+    # variable length columns as (indptr, indices)
+    indptr = np.cumsum([0] + [len(column) for column in columns]).astype(np.int64)
+    indices = np.array([j for column in columns for j in column], dtype=np.int64)
+    return indptr, indices
+
+
+def _nested(indptr, indices):
+    return [indices[indptr[i]:indptr[i + 1]].tolist() for i in range(len(indptr) - 1)]
+
+
+def save_checkpoint(filename, key, count, y, pool, stabilizer, termination, timings):
+    """Write the state of the main loop after iteration count to filename."""
+    master = pool.master
+    inactive = list(pool.inactive)
+    restore = set(pool.restore)
+    arrays = {"y": np.asarray(y, dtype=np.float64), "obj": np.asarray(master.obj, dtype=np.float64),
+              "keep": pool.keep, "age": pool.age,
+              "inactive_obj": np.array([pool.inactive[k][1] for k in inactive], dtype=np.float64),
+              "inactive_restore": np.array([k in restore for k in inactive], dtype=np.bool_),
+              "center": stabilizer.center if stabilizer.center is not None else np.zeros(0)}
+    arrays["indptr"], arrays["indices"] = _flat(master.columns)
+    arrays["inactive_indptr"], arrays["inactive_indices"] = _flat([pool.inactive[k][0] for k in inactive])
+    meta = {"format": FORMAT, "key": key, "count": count, "bound": stabilizer.bound, "estimate": stabilizer.estimate,
+            "has_center": stabilizer.center is not None, "history": termination.history, "timings": timings,
+            "duplicates": pool.num_duplicates, "removed": pool.num_removed, "restored": pool.num_restored}
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    handle, partial = tempfile.mkstemp(dir=directory, suffix=".npz")
+    with os.fdopen(handle, "wb") as f:
+        np.savez(f, **arrays)
+    os.rename(partial, filename)
+
+
+def load_checkpoint(filename, key):
+    """The state saved in filename, None if there is no checkpoint. Raises ValueError for another timetable."""
+    if not os.path.isfile(filename):
+        return None
+    with np.load(filename) as data:
+        state = dict((name, data[name]) for name in data.files)
+    meta = json.loads(state.pop("meta").tobytes().decode("utf-8"))
+    if meta["format"] != FORMAT or meta["key"] != key:
+        raise ValueError("checkpoint {0} was saved for another input file or version".format(filename))
+    state.update(meta)
+    return state
+
+
+def restore_checkpoint(state, pool, stabilizer, termination):
+    """Put the columns of state into the empty master of pool and restore the loop state.
+
+    Returns (count, y, timings) of the saved iteration. The master still has to be solved.
+    """
+    master = pool.master
+    columns = _nested(state["indptr"], state["indices"])
+    master.add_columns(columns, state["obj"].tolist())
+    pool.keys = [frozenset(column) for column in columns]
+    pool.index = dict((key, i) for i, key in enumerate(pool.keys))
+    pool.keep = state["keep"].astype(np.bool_)
+    pool.age = state["age"].astype(np.int64)
+    y = state["y"]
+    pool.reduced_costs = reduced_costs(master.columns, master.obj, y)
+
+    inactive = _nested(state["inactive_indptr"], state["inactive_indices"])
+    pool.inactive = dict((frozenset(column), (column, c))
+                         for column, c in zip(inactive, state["inactive_obj"].tolist()))
+    pool.restore = [frozenset(column) for column, restore in zip(inactive, state["inactive_restore"]) if restore]
+    pool.num_duplicates, pool.num_removed, pool.num_restored = state["duplicates"], state["removed"], state["restored"]
+
+    stabilizer.bound, stabilizer.estimate = state["bound"], state["estimate"]
+    stabilizer.center = state["center"] if state["has_center"] else None
+    termination.history = list(state["history"])
+    return state["count"], y.tolist(), state["timings"]
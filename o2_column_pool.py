@@ -0,0 +1,114 @@
+# -------------------------------------------------------------------------------
+# Name:        Column pool of the O^2 Challenge restricted master problem
+#
+# Every column is keyed by the set of rides it covers, a shift that is already
+# in the master is never added twice. After every LP solve the pool computes
+# the reduced costs of its columns; a column that stays out of the solution
+# with a large reduced cost for max_age solves in a row is taken out of the
+# master and kept aside, it comes back as soon as its reduced cost is negative
+# again or the pricing finds it a second time.
+# -------------------------------------------------------------------------------
+
+import numpy as np
+
+
+def reduced_costs(columns, obj, y):
+    # obj - sum of the duals of the covered rides, for every column
+    if len(columns) == 0:
+        return np.zeros(0)
+    y = np.asarray(y, dtype=np.float64)
+    lengths = np.array([len(column) for column in columns], dtype=np.int64)
+    index = np.array([j for column in columns for j in column], dtype=np.int64)
+    return np.asarray(obj, dtype=np.float64) - np.add.reduceat(y[index], np.cumsum(lengths) - lengths)
+
+
+class ColumnPool(object):
+    """Columns of a MasterProblem, max_age = 0 keeps every column in the master."""
+
+    def __init__(self, master, max_age=0, min_reduced_cost=0.1):
+        self.master = master
+        self.max_age = max_age
+        self.min_reduced_cost = min_reduced_cost
+
+        # entry i describes column i of the master
+        self.keys = []
+        self.keep = np.zeros(0, dtype=np.bool_)  # never removed, the initial columns keep the master feasible
+        self.age = np.zeros(0, dtype=np.int64)  # LP solves in a row out of the solution with a large reduced cost
+        self.reduced_costs = np.zeros(0)  # for the duals of the last LP solve
+        self.index = {}  # key -> column
+
+        self.inactive = {}  # key -> (column, obj) of the columns taken out of the master
+        self.restore = []  # keys of inactive columns with a negative reduced cost, added back with the next add
+        self.num_duplicates = 0
+        self.num_removed = 0
+        self.num_restored = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, column):
+        return frozenset(column) in self.index
+
+    def add(self, columns, obj, keep=False):
+        """Add the columns that are not in the master yet and the ones to restore, returns how many were added."""
+        self._remove_aged()
+
+        columns, obj = list(columns), list(obj)
+        for key in self.restore:
+            columns.append(self.inactive[key][0])
+            obj.append(self.inactive[key][1])
+        self.restore = []
+
+        new_columns, new_obj = [], []
+        for column, c in zip(columns, obj):
+            key = frozenset(column)
+            if key in self.index:
+                self.num_duplicates += 1
+                continue
+            if key in self.inactive:
+                self.num_restored += 1
+                del self.inactive[key]
+            self.index[key] = len(self.keys)
+            self.keys.append(key)
+            new_columns.append(column)
+            new_obj.append(c)
+
+        if new_columns:
+            self.master.add_columns(new_columns, new_obj)
+            self.keep = np.concatenate([self.keep, np.full(len(new_columns), keep, dtype=np.bool_)])
+            self.age = np.concatenate([self.age, np.zeros(len(new_columns), dtype=np.int64)])
+            self.reduced_costs = np.concatenate([self.reduced_costs, np.zeros(len(new_columns))])
+        return len(new_columns)
+
+    def update(self, y):
+        """Reduced costs, and with aging the ages and the columns to restore, after an LP solve with duals y."""
+        self.reduced_costs = reduced_costs(self.master.columns, self.master.obj, y)
+        if self.max_age <= 0:
+            return
+
+        out = (np.asarray(self.master.values()) <= 1e-9) & (self.reduced_costs > self.min_reduced_cost)
+        self.age = np.where(out, self.age + 1, 0)
+
+        keys = list(self.inactive)
+        costs = reduced_costs([self.inactive[key][0] for key in keys], [self.inactive[key][1] for key in keys], y)
+        self.restore = [keys[i] for i in np.flatnonzero(costs < -1e-9)]
+
+    def _remove_aged(self):
+        # done right before columns are added, so the master is re-solved anyway
+        if self.max_age <= 0 or len(self.keys) == 0:
+            return
+        aged = np.flatnonzero((self.age >= self.max_age) & ~self.keep)
+        if len(aged) == 0:
+            return
+
+        for i in aged:
+            self.inactive[self.keys[i]] = (self.master.columns[i], self.master.obj[i])
+        self.master.remove_columns(aged)
+        remaining = np.ones(len(self.keys), dtype=np.bool_)
+        remaining[aged] = False
+        self.keys = [key for key, kept in zip(self.keys, remaining) if kept]
+        self.index = dict((key, i) for i, key in enumerate(self.keys))
+        self.keep = self.keep[remaining]
+        self.age = self.age[remaining]
+        self.reduced_costs = self.reduced_costs[remaining]
+        self.num_removed += len(aged)
@@ -0,0 +1,282 @@
+# -------------------------------------------------------------------------------
+# Name:        Warm solver service for the O^2 Challenge
+#
+# A run of test.py spends much of a small timetable on starting up: importing
+# the solver and numba and compiling the pricing kernels. The server keeps a
+# pool of worker processes that did all that once, on a small generated
+# timetable, and solves the timetables sent to it on a Unix socket. A request
+# is one JSON line, the server answers with JSON lines: "accepted", then the
+# telemetry records of the run as they come (see o2_telemetry), then "result"
+# with the duty of every ride, or "error". Requests are solved side by side on
+# the workers, up to max_pending more wait for one, and the rest are turned away.
+# A request that has no answer within the timeout of the server (a worker that
+# died, or a run far over its limits) gets an "error" and frees its place.
+#
+# Usage: python o2_daemon.py serve --socket o2.sock --workers 2 --master-backend highs
+#        python o2_daemon.py submit large_data_csv.csv --socket o2.sock --max-car-num 2 --deadline 60
+# -------------------------------------------------------------------------------
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+try:
+    import socketserver
+    from queue import Empty
+except ImportError:  # python 2
+    import SocketServer as socketserver
+    from Queue import Empty
+
+# the run() arguments a request may set, the server decides on the others
+RUN_OPTIONS = ["original_obj_coefficients", "stable", "max_switches", "changeover_window", "columns_per_iter",
+               "dual_smoothing", "master_backend", "max_column_age", "gap_tolerance", "integer_gap", "tailing_off",
+               "deadline", "warm_start", "seed"]
+
+
+def _init_worker(backend, warm_up):
+    # runs once in every worker. the solver is imported here and not at the top, a client does not pay for it,
+    # and with warm_up a few iterations on a small timetable load the solver library and compile the pricing
+    from o2_bench import generate_timetable
+    from o2_engine import run
+    from o2_telemetry import Telemetry
+    from o2_worker import call_logged
+    if not warm_up:
+        return
+    directory = tempfile.mkdtemp(prefix="o2_warm_")
+    try:
+        input_file = os.path.join(directory, "input.csv")
+        generate_timetable(input_file, num_buses=4, trips_per_block=6, num_relief_stops=2)
+        # a warm-up that fails only leaves the worker cold, the requests tell what is wrong
+        call_logged(os.devnull, None, run, 5, 1, input_file, os.path.join(directory, "output"),
+                    master_backend=backend, max_switches=1, telemetry=Telemetry())
+    finally:
+        shutil.rmtree(directory)
+
+
+def _solve(job):
+    # worker process: solve one request in a directory of its own, the telemetry records go to queue
+    request_id, timetable, input_file, max_num_of_iter, max_seconds_of_final, options, cache_dir, queue = job
+    directory = None
+    try:
+        # everything that may fail is in here, the handler waits for the record this returns
+        from o2_engine import O2Parser, run
+        from o2_telemetry import Telemetry
+        from o2_verifier import MAX_CHANGEOVERS, read_solution, verify
+        from o2_worker import call_logged
+        directory = tempfile.mkdtemp(prefix="o2_request_")
+        if input_file is None:
+            input_file = os.path.join(directory, "input.csv")
+            with open(input_file, "w") as f:
+                f.write(timetable)
+        telemetry = Telemetry(callback=lambda record: queue.put(dict(record, id=request_id)))
+        stats, error = call_logged(os.path.join(directory, "run.log"), None, run, max_num_of_iter,
+                                   max_seconds_of_final, input_file, os.path.join(directory, "output"),
+                                   telemetry=telemetry, cache_dir=cache_dir, **options)
+        if error is not None:
+            return {"type": "error", "id": request_id, "message": error}
+        duties = read_solution(stats["output_file"])
+        max_switches = options.get("max_switches", 0)
+        trips = O2Parser.pars(input_file, max_switches, options.get("changeover_window", (0, 0)),
+                              cache_dir=cache_dir)[0]
+        result = verify(trips, duties, max(MAX_CHANGEOVERS, max_switches))
+        del stats["output_file"]  # gone with the directory
+        return {"type": "result", "id": request_id, "stats": stats, "duties": [int(d) for d in duties],
+                "verified": result["acceptable"], "total_time": result["total_time"]}
+    except Exception as error:
+        return _error(request_id, error)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def _error(request_id, error):
+    return {"type": "error", "id": request_id, "message": "{0}: {1}".format(type(error).__name__, error)}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def send(self, record):
+        # the client may be gone, the run goes on anyway until its slot is free again
+        try:
+            self.wfile.write((json.dumps(record, sort_keys=True) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        except (IOError, OSError):
+            pass
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            job = self.server.job(request)
+        except ValueError as error:
+            self.send({"type": "error", "message": str(error)})
+            return
+        if not self.server.slots.acquire(False):
+            self.send({"type": "error", "message": "busy, {0} requests are running or waiting".format(
+                self.server.capacity)})
+            return
+        try:
+            request_id, queue = job[0], job[-1]
+            self.send({"type": "accepted", "id": request_id})
+            # _solve answers with a record of its own, on python 3 an error it did not catch is posted too,
+            # and the timeout covers a worker that died
+            kwargs = {}
+            if sys.version_info[0] >= 3:
+                kwargs["error_callback"] = lambda error: queue.put(_error(request_id, error))
+            self.server.pool.apply_async(_solve, (job,), callback=queue.put, **kwargs)
+            give_up = time.time() + self.server.request_timeout
+            while True:
+                try:
+                    record = queue.get(timeout=max(give_up - time.time(), 0))
+                except Empty:
+                    self.send({"type": "error", "id": request_id, "message": "no answer within {0} seconds".format(
+                        self.server.request_timeout)})
+                    break
+                if record["type"] != "iteration" or request.get("progress", True):
+                    self.send(record)
+                if record["type"] in ("result", "error"):
+                    break
+        finally:
+            self.server.slots.release()
+
+
+class SolverServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Solves the timetables sent to socket_path on worker processes, up to max_pending more wait for one.
+
+    backend is the master backend the workers are warmed up with and the default of the requests, threads caps
+    the solver threads of every run (by default the cores are split between the workers). Parsed timetables
+    are kept in cache_dir, so the what-if requests on one timetable parse it once. A request that has no answer
+    request_timeout seconds after it was accepted, waiting for a worker included, gets an error.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, workers=2, max_pending=8, backend="cplex", threads=None, cache_dir=None,
+                 warm_up=True, request_timeout=3600):
+        if threads is None:
+            threads = max(multiprocessing.cpu_count() // workers, 1)
+        self.defaults = {"master_backend": backend, "solver_threads": threads}
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir is not None else None
+        self.capacity = workers + max_pending
+        self.request_timeout = request_timeout
+        self.slots = threading.Semaphore(self.capacity)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+        # the workers start before the socket is bound, so they do not hold it open
+        self.manager = multiprocessing.Manager()
+        self.pool = multiprocessing.Pool(workers, _init_worker, (backend, warm_up))
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # left behind by a server that was killed
+        socketserver.UnixStreamServer.__init__(self, socket_path, RequestHandler)
+
+    def job(self, request):
+        """The arguments of _solve for request. Raises ValueError when the request is not valid."""
+        if not isinstance(request, dict):
+            raise ValueError("a request is a JSON object")
+        if ("timetable" in request) == ("input" in request):
+            raise ValueError("a request has either a timetable (the content of an input file) or an input file")
+        options = dict(request.get("options") or {})
+        unknown = sorted(set(options) - set(RUN_OPTIONS))
+        if unknown:
+            raise ValueError("unknown options {0}, a request may set {1}".format(unknown, RUN_OPTIONS))
+        for name in ["changeover_window", "tailing_off"]:
+            if options.get(name) is not None:
+                options[name] = tuple(options[name])
+        for name, value in self.defaults.items():
+            options.setdefault(name, value)
+        input_file = os.path.abspath(request["input"]) if "input" in request else None
+        with self.lock:
+            request_id = next(self.ids)
+        return (request_id, request.get("timetable"), input_file, int(request.get("max_num_of_iter", 1000)),
+                int(request.get("max_seconds_of_final", 300)), options, self.cache_dir, self.manager.Queue())
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.terminate()
+        self.pool.join()
+        self.manager.shutdown()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def submit(socket_path, request):
+    """Send request to the server at socket_path, yields the records it sends back. The last is "result" or "error"."""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(socket_path)
+    try:
+        connection.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        stream = connection.makefile("rb")
+        for line in iter(stream.readline, b""):
+            yield json.loads(line.decode("utf-8"))
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm solver service, or a request to it.")
+    commands = parser.add_subparsers(dest="command")
+    serve = commands.add_parser("serve", help="start the server")
+    serve.add_argument("--socket", default="o2.sock")
+    serve.add_argument("--workers", type=int, default=2, help="requests solved at a time")
+    serve.add_argument("--max-pending", type=int, default=8, help="requests waiting for a worker")
+    serve.add_argument("--master-backend", default="cplex")
+    serve.add_argument("--threads", type=int, default=None, help="solver threads of every run")
+    serve.add_argument("--cache-dir", default="cache")
+    serve.add_argument("--no-warm-up", action="store_true")
+    serve.add_argument("--request-timeout", type=float, default=3600,
+                       help="seconds a request may wait for its answer")
+    request = commands.add_parser("submit", help="solve a timetable on the server")
+    request.add_argument("input")
+    request.add_argument("--socket", default="o2.sock")
+    request.add_argument("--max-iter", type=int, default=1000)
+    request.add_argument("--max-seconds-of-final", type=int, default=300)
+    request.add_argument("--max-car-num", type=int, default=1, help="vehicles a driver may use")
+    request.add_argument("--columns-per-iter", type=int, default=1)
+    request.add_argument("--dual-smoothing", type=float, default=0.0)
+    request.add_argument("--max-column-age", type=int, default=0)
+    request.add_argument("--integer-gap", type=int, default=None)
+    request.add_argument("--deadline", type=float, default=None, help="seconds for the whole run, see o2_anytime")
+    request.add_argument("--warm-start", type=int, default=None, help="randomized variants of the initial duties")
+    request.add_argument("--output", default=None, help="write the duty of every ride to this file")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = SolverServer(args.socket, args.workers, args.max_pending, args.master_backend, args.threads,
+                              args.cache_dir, not args.no_warm_up, args.request_timeout)
+        print("Serving on {0} with {1} workers".format(args.socket, args.workers))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    options = {"max_switches": args.max_car_num - 1, "columns_per_iter": args.columns_per_iter,
+               "dual_smoothing": args.dual_smoothing, "max_column_age": args.max_column_age,
+               "integer_gap": args.integer_gap, "deadline": args.deadline, "warm_start": args.warm_start}
+    record = {}
+    for record in submit(args.socket, {"input": os.path.abspath(args.input), "max_num_of_iter": args.max_iter,
+                                       "max_seconds_of_final": args.max_seconds_of_final, "options": options}):
+        if record["type"] == "iteration" and record["iteration"] % 10 == 0:
+            print("Iteration {0}: master {1}, {2} columns, {3:.1f}s".format(
+                record["iteration"], record["master_objective"], record["columns"], record["elapsed"]))
+    if record.get("type") != "result":
+        print("Failed: {0}".format(record.get("message")))
+        sys.exit(2)
+    print("{0} duties, secondary objective {1}, {2}".format(
+        record["stats"]["duties"], record["total_time"], "verified" if record["verified"] else "NOT verified"))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.writelines("{0}\n".format(duty) for duty in record["duties"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# -------------------------------------------------------------------------------
+# Name:        Independent parts of the O^2 Challenge timetable
+#
+# Two rides can only share a duty when a chain of connections (the same bus or
+# a changeover) joins them, so every component of the connection graph is a
+# problem of its own: without changeovers every bus is one. The rides of each
+# component are written to an input file of their own and solved by run() of
+# onecar, twocars or o2_engine on a pool of worker processes, then the solutions
+# are merged into one output file in the order of the input with unique duty ids.
+# -------------------------------------------------------------------------------
+
+import importlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from o2_engine import O2Parser, SolverError
+from o2_telemetry import Telemetry, mip_gap
+from o2_timetable import components
+from o2_worker import call_logged
+
+
+def split_timetable(input_file_name, work_dir, max_switches=0, changeover_window=(0, 0), cache_dir=None):
+    """Write the rides of every component to work_dir/<component>/input.csv.
+
+    Returns the component of every ride and the input file of every component.
+    """
+    trips, successors, changeovers, bus_to_nodes = O2Parser.pars(input_file_name, max_switches, changeover_window,
+                                                                 cache_dir=cache_dir)
+    labels = components(len(trips), successors, changeovers)
+
+    # same lines as the parser reads: the header, then one ride per line that is not empty
+    with open(input_file_name) as f:
+        header = f.readline()
+        lines = [line if line.endswith("\n") else line + "\n" for line in f if line.strip()]
+
+    files = []
+    for component in range(labels.max() + 1 if len(labels) else 0):
+        directory = os.path.join(work_dir, str(component))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        files.append(os.path.join(directory, "input.csv"))
+        with open(files[-1], "w") as f:
+            f.write(header)
+            f.writelines(lines[i] for i in np.flatnonzero(labels == component))
+    return labels, files
+
+
+def _solve_component(job):
+    # worker process: run the model in the directory of the component, its lp files and output stay there
+    model, component, input_file, max_num_of_iter, max_seconds_of_final, kwargs = job
+    directory = os.path.dirname(os.path.abspath(input_file))
+    stats, error = call_logged("run.log", directory, importlib.import_module(model).run, max_num_of_iter,
+                               max_seconds_of_final, "input.csv", os.path.join(directory, "output"),
+                               telemetry=Telemetry(os.path.join(directory, "telemetry.jsonl")), **kwargs)
+    if error is not None:
+        # the merged solution needs every component
+        raise SolverError("component {0} failed ({1}), see {2}".format(
+            component, error, os.path.join(directory, "run.log")))
+    return component, stats
+
+
+def run_components(model, max_num_of_iter, max_seconds_of_final, input_file_name, output_file_name, processes=1,
+                   work_dir=None, **kwargs):
+    """run() of model on every component of the timetable, processes components at a time.
+
+    model is onecar, twocars or o2_engine and kwargs go to its run(). The output file has the name run()
+    would give it, the statistics add up the ones of the components.
+    """
+    started = time.time()
+    keep_work_dir = work_dir is not None
+    work_dir = work_dir if keep_work_dir else tempfile.mkdtemp(prefix="o2_components_")
+    # the workers run in directories of their own, the parts of a timetable have the same cache entries every time
+    if kwargs.get("cache_dir") is not None:
+        kwargs["cache_dir"] = os.path.abspath(kwargs["cache_dir"])
+    # the changeovers of the model join the buses into components
+    max_switches = kwargs.get("max_switches", getattr(importlib.import_module(model), "MAX_SWITCHES", 0))
+    labels, files = split_timetable(input_file_name, work_dir, max_switches, kwargs.get("changeover_window", (0, 0)),
+                                    kwargs.get("cache_dir"))
+    sizes = np.bincount(labels)
+    print("{0} rides in {1} components, the largest has {2} rides".format(len(labels), len(files), sizes.max()))
+
+    # a worker cannot start a pool of its own
+    if processes > 1:
+        kwargs["pricing_processes"] = 1
+
+    # largest components first, so a big one does not start last
+    jobs = [(model, component, files[component], max_num_of_iter, max_seconds_of_final, kwargs)
+            for component in np.argsort(-sizes, kind="mergesort").tolist()]
+    if processes > 1:
+        pool = multiprocessing.Pool(min(processes, len(jobs)))
+        results = dict(pool.imap_unordered(_solve_component, jobs))
+        pool.close()
+        pool.join()
+    else:
+        results = dict(_solve_component(job) for job in jobs)
+
+    # duty ids of every component become consecutive ids after the ones of the components before it
+    duties = np.zeros(len(labels), dtype=np.int64)
+    next_id = 0
+    for component in range(len(files)):
+        with open(results[component]["output_file"]) as f:
+            local = np.array([int(line) for line in f if line.strip()], dtype=np.int64)
+        unique, first, inverse = np.unique(local, return_index=True, return_inverse=True)
+        rank = np.empty(len(unique), dtype=np.int64)
+        rank[np.argsort(first)] = np.arange(len(unique))
+        duties[labels == component] = next_id + rank[inverse.reshape(-1)]
+        next_id += len(unique)
+
+    output_file = output_file_name + '_max_iter{0}_maxtime{1}.csv'.format(max_num_of_iter, max_seconds_of_final)
+    with open(output_file, "w") as f:
+        f.writelines("{0}\n".format(duty) for duty in duties.tolist())
+
+    parts = [results[component] for component in range(len(files))]
+    stats = {"output_file": output_file, "rides": len(labels), "components": len(files),
+             "iterations": max(part["iterations"] for part in parts),
+             "duties": next_id, "timings": {"wall": time.time() - started}}
+    for name in ["columns", "lp_bound", "lower_bound", "objective"]:
+        stats[name] = sum(part[name] for part in parts)
+    for name in parts[0]["timings"]:
+        stats["timings"][name] = sum(part["timings"][name] for part in parts)  # seconds of all the workers
+    stats["mip_gap"] = mip_gap(stats["objective"], stats["lp_bound"])
+    stats["stop_reason"] = ", ".join(sorted(set(part["stop_reason"] for part in parts)))
+
+    print("Best integer solution found {0}, LP relaxation {1}, lower bound {2}, {3} components".format(
+        stats["objective"], stats["lp_bound"], stats["lower_bound"], len(files)))
+    if not keep_work_dir:
+        shutil.rmtree(work_dir)
+    return stats
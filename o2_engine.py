@@ -0,0 +1,333 @@
+# -------------------------------------------------------------------------------
+# Name:        Column generation engine for the O^2 Challenge
+#
+# Duties are built by column generation over the rides of the timetable: the
+# master is a set partitioning LP (see o2_master), the pricing finds the best
+# duty for its duals (see o2_pricing) and the final columns are solved as an
+# integer program. A driver may change vehicles up to max_switches times per
+# duty, onecar (0) and twocars (1) are this engine with their own limit.
+# -------------------------------------------------------------------------------
+
+import time
+from o2_ingest import read_trips
+from o2_timetable import Successors, same_bus_arcs, changeover_arcs
+from o2_pricing import Pricer, ParallelPricer
+from o2_stabilization import DualSmoothing
+from o2_master import make_master, ride_duties
+from o2_column_pool import ColumnPool
+from o2_termination import Termination, lp_gap
+from o2_telemetry import Telemetry, mip_gap
+from o2_cache import cache_key, cached_pars
+from o2_checkpoint import save_checkpoint, load_checkpoint, restore_checkpoint
+from o2_anytime import Deadline, Incumbent, round_duties
+from o2_warmstart import initial_duties
+from o2_verifier import MAX_CHANGEOVERS
+import csv
+import numpy as np
+
+
+class SolverError(Exception):
+    """run() cannot go on: the master has no solution, or no integer solution covers every ride once."""
+
+
+class O2Parser(object):
+
+    # part of the cache key, change it whenever pars returns something else for the same file
+    VERSION = "o2parser-1"
+
+    @staticmethod
+    def tag(max_switches=0, changeover_window=(0, 0)):
+        # the version and the arguments of pars, for the keys of the cache and of checkpoints
+        return "{0} {1} {2}".format(O2Parser.VERSION, max_switches, list(changeover_window))
+
+    @staticmethod
+    def pars(filename, max_switches=0, changeover_window=(0, 0), cache_dir=None):
+        # with a cache_dir a file parsed before with the same arguments is loaded from there, see o2_cache
+        if cache_dir is not None:
+            return cached_pars(cache_dir, filename, O2Parser.tag(max_switches, changeover_window),
+                               lambda: O2Parser.pars(filename, max_switches, changeover_window))
+
+        # read and check the file chunk by chunk straight into the trip arrays, see o2_ingest
+        trips = read_trips(filename)
+        bus_to_nodes = trips.bus_to_nodes()
+
+        # "start" and "target" are implicit: every ride may begin or end a shift
+        # connect between each ride and the next ride of the same bus
+        from_nodes, to_nodes, dropped = same_bus_arcs(trips)
+        if dropped:
+            print("Dropped {0} same-bus connections (location mismatch or overlap)".format(dropped))
+        successors = Successors.from_arcs(len(trips), from_nodes, to_nodes)
+
+        # a driver who may still switch can move to another bus that leaves the stop where the current ride ends
+        # within the changeover window. the arcs are not copied per switch, see o2_pricing
+        if max_switches > 0:
+            changeover_from, changeover_to = changeover_arcs(trips, changeover_window)
+        else:
+            changeover_from = changeover_to = np.zeros(0, dtype=np.int32)
+        changeovers = Successors.from_arcs(len(trips), changeover_from, changeover_to)
+
+        return trips, successors, changeovers, bus_to_nodes
+
+
+def run(max_num_of_iter, max_seconds_of_final, input_file_name, output_file_name, original_obj_coefficients=1, stable=False,
+        max_switches=0, changeover_window=(0, 0), columns_per_iter=1, pricing_processes=1, dual_smoothing=0.0,
+        master_backend="cplex", telemetry=None, max_column_age=0, gap_tolerance=None, integer_gap=None,
+        tailing_off=None, cache_dir=None, checkpoint_file=None, checkpoint_every=0, resume=False, write_lp=False,
+        solver_threads=None, deadline=None, warm_start=None, seed=0):
+    # max_switches: how many times a driver may change vehicles during a duty
+    # changeover_window: (min, max) minutes between arriving at a stop and leaving it on another bus
+    # deadline: seconds of wall clock time for the whole run, the MIP gets what the pricing leaves of it and
+    # max_seconds_of_final is ignored, see o2_anytime
+    # warm_start: None starts from the single ride columns only, a number n >= 0 adds the duties cut greedily from
+    # the bus blocks and from n randomized variants (drawn with seed) before the first solve, see o2_warmstart
+    clock = Deadline(deadline) if deadline is not None else None
+    # wall clock seconds spent in every phase, returned with the other run statistics
+    timings = {"parse": 0.0, "pricing": 0.0, "master": 0.0, "mip": 0.0}
+
+    # one record per iteration and a summary at the end, see o2_telemetry
+    if telemetry is None:
+        telemetry = Telemetry(print_every=10)
+
+    started = time.time()
+    # with a cache_dir the parsed timetable is kept on disk for the next runs on the same file
+    trips, successors, changeovers, bus_to_nodes = O2Parser.pars(input_file_name, max_switches, changeover_window,
+                                                                 cache_dir=cache_dir)
+    timings["parse"] = time.time() - started
+    J = len(trips)
+    output_file = output_file_name + '_max_iter{0}_maxtime{1}.csv'.format(max_num_of_iter, max_seconds_of_final)
+
+    # in anytime mode the best verified solution is in the output file all along, starting with a duty per ride
+    incumbent = None
+    if clock is not None:
+        incumbent = Incumbent(trips, output_file, max(MAX_CHANGEOVERS, max_switches))
+        incumbent.offer(np.arange(J), "rides")
+
+    # Create the model of the master problem, see o2_master for the available backends
+    master = make_master(master_backend, J, stable)
+    if solver_threads is not None:  # runs side by side share the cores, see o2_sweep
+        master.threads(solver_threads)
+
+    # columns go through the pool, which skips duplicates and with max_column_age > 0 takes out columns that
+    # stayed out of the LP solution with a large reduced cost for that many solves, see o2_column_pool
+    pool = ColumnPool(master, max_column_age)
+
+    # with dual_smoothing = alpha > 0 the sub problem sees alpha * (best bound duals) + (1 - alpha) * (master duals)
+    # the valid lower bound is slow to compute, it is kept up to date only for the stopping rules that compare with it
+    stabilizer = DualSmoothing(dual_smoothing, exact=gap_tolerance is not None or integer_gap is not None)
+
+    # stop before the end once the master value is close enough to the lower bound or stops moving, see o2_termination
+    termination = Termination(gap_tolerance, integer_gap, tailing_off)
+    stop_reason = "optimal"
+
+    # with a checkpoint_file the state of the main loop is saved every checkpoint_every iterations, and with resume
+    # the run goes on from the last checkpoint instead of starting over, see o2_checkpoint
+    checkpoint_key = None
+    if checkpoint_file is not None:
+        checkpoint_key = cache_key(input_file_name, O2Parser.tag(max_switches, changeover_window))
+    state = load_checkpoint(checkpoint_file, checkpoint_key) if checkpoint_file is not None and resume else None
+    count = 0
+    if state is None:
+        # initial possible solution: J rides, Id matrix of size JxJ
+        pool.add([[j] for j in range(J)], [original_obj_coefficients] * J, keep=True)
+        if warm_start is not None:
+            columns, greedy = initial_duties(trips, successors, bus_to_nodes, warm_start, seed)
+            added = pool.add(columns, [1] * len(columns))
+            print("Warm start: {0} duties cut from the bus blocks, {1} of them new".format(len(columns), added))
+            if incumbent is not None:
+                incumbent.offer(greedy, "bus blocks")
+    else:
+        count, y, saved_timings = restore_checkpoint(state, pool, stabilizer, termination)
+        timings["pricing"], timings["master"] = saved_timings["pricing"], saved_timings["master"]
+        print("Resuming after iteration {0} with {1} columns".format(count, master.num_columns()))
+
+    # Solve the master problem with initial set of columns
+    # master.write("myfirst.lp")  # uncomment to debug the model
+    started = time.time()
+    if not master.solve():  # optimal solution not found
+        print("Panic: cannot find feasible solution for the initial master problem")
+        raise SolverError("cannot find feasible solution for the initial master problem")
+    timings["master"] += time.time() - started
+
+    print("Optimal solution value of initial master problem ", master.objective_value())
+
+    if state is None:
+        y = master.dual_values()  # get dual solution from the solver
+        pool.update(y)
+
+    # -------------------------------------------------------------------------------------------------------------------
+    # prepare sub problem  - we do it once here and only change the objective function coefficients at each iteration.
+    # the sub problem is to find a driver route that if added will help the most. we represent the problem as a graph
+    # whose nodes are the possible drives and the edges are the transfers between drives...
+    # the labels are computed by compiled kernels over flat arrays, see o2_pricing
+    # with pricing_processes > 1 the bus blocks are priced on a pool of worker processes
+    if pricing_processes > 1:
+        pricer = ParallelPricer(trips, successors, bus_to_nodes, pricing_processes, changeovers, max_switches)
+    else:
+        pricer = Pricer(trips, successors, bus_to_nodes, changeovers, max_switches)
+
+    # Main loop
+    while True:
+
+        # count is the number of iterations done, it goes up once the checks let the next one start
+        if count >= max_num_of_iter:
+            print("Panic: got tired after {0} iterations, master {1}, bound estimate {2}, gap {3:.2%}".format(
+                max_num_of_iter, master.objective_value(), stabilizer.estimate,
+                lp_gap(master.objective_value(), stabilizer.estimate)))
+            stop_reason = "iterations"
+            print("\ngetting optimal solution up to now:")
+            # sys.exit(-1)
+            break
+        if clock is not None:
+            clock.lap()
+            if clock.stop_pricing():
+                print("Deadline: stopping after {0} iterations with {1:.1f} of {2} seconds left, master {3}, "
+                      "bound estimate {4}".format(count, clock.remaining(), deadline, master.objective_value(),
+                                                  stabilizer.estimate))
+                stop_reason = "deadline"
+                break
+        count += 1
+
+        # up to columns_per_iter improving shifts, each starting in a different bus block
+        started = time.time()
+        max_shifts = stabilizer.get_shifts(pricer, y, columns_per_iter, 1 + 1e-12)
+        record = {"iteration": count, "pricing_time": time.time() - started, "master_time": 0.0, "new_columns": 0,
+                  "best_reduced_cost": 1 - max_shifts["max_value"], "nonzero_duals": sum(1 for v in y if abs(v) > 1e-9),
+                  "lower_bound": stabilizer.bound, "bound_estimate": stabilizer.estimate, "alpha": max_shifts["alpha"],
+                  "mispricings": stabilizer.mispricings}
+        timings["pricing"] += record["pricing_time"]
+        record["gap"] = lp_gap(master.objective_value(), stabilizer.bound)
+
+        # ---------------------------------------------------------------------------------------------------------------
+
+        improving = max_shifts["max_value"] > 1 + 1e-12
+        stopped = improving and termination.check(master.objective_value(), stabilizer.bound) is not None
+        if stopped:
+            print("Stopping after {0} iterations ({1}): master {2}, lower bound {3}".format(
+                count, termination.reason, master.objective_value(), stabilizer.bound))
+            stop_reason = termination.reason
+
+        if (improving or pool.restore) and not stopped:
+            # if it did then create new columns for the master problem based on the solutions of the sub problem
+            # (removed columns whose reduced cost is negative again are added back with them)
+            new_columns = []
+            for path in max_shifts['paths'] if improving else []:
+                ez = [j % J for j in path]
+                assert len(set(ez)) == len(ez), "somewhere it took a ride more then once in path"
+                new_columns.append(ez)
+
+            # for (k, i) in L:
+            #     if z[L.index((k, i))] > 1e-6:
+            #         ez.append(L.index((k, i)))
+
+            record["new_columns"] = pool.add(new_columns, [1] * len(new_columns))
+            # master.write("main.lp")
+            # resolve master problem
+            started = time.time()
+            if not master.solve():  # optimal solution not found
+                print("Panic: cannot find feasible solution for the master problem")
+                pricer.close()
+                raise SolverError("cannot find feasible solution for the master problem")
+            record["master_time"] = time.time() - started
+            timings["master"] += record["master_time"]
+
+            y = master.dual_values()  # update dual solution
+            pool.update(y)
+
+            # all the shifts were in the master already, the LP cannot improve
+            improving = record["new_columns"] > 0
+
+        if incumbent is not None:
+            incumbent.offer(round_duties(J, master.columns, master.values()), "rounding")
+            record["incumbent"] = incumbent.value
+
+        telemetry.iteration(columns=master.num_columns(), master_objective=master.objective_value(),
+                            duplicates=pool.num_duplicates, removed=pool.num_removed, restored=pool.num_restored,
+                            inactive=len(pool.inactive), **record)
+        if stopped or not improving:  # if not - we are done
+            break
+        if checkpoint_file is not None and checkpoint_every > 0 and count % checkpoint_every == 0:
+            save_checkpoint(checkpoint_file, checkpoint_key, count, y, pool, stabilizer, termination, timings)
+
+    # the stopping rules may not have needed a valid bound on the way, one at the last duals costs one labelling
+    # (in anytime mode the time left is the MIP's)
+    if clock is None:
+        stabilizer.bound_at(pricer, y)
+    pricer.close()
+
+    # print final fractional solution
+    # x = master.values()
+    # for i in range(master.num_columns()):
+    #     if x[i] > 1e-6:
+    #         print(i, x[i])
+
+    # the pricing is a heuristic, even when it finds no more columns the master value may be above the LP optimum,
+    # the valid lower bound is the one of the stabilizer
+    lp_value = master.objective_value()
+
+    # *** resolve the model as an integer programming model ***
+
+    # change the type of all the variables from continuous (default) to integer
+    master.set_integer()
+
+    # add constraint to force not taking single trip routes
+    # c_master.linear_constraints.add(lin_expr=A, senses="E" * J, rhs=[0] * J)
+    # tup = zip(range(J), [original_obj_coefficients] * J)
+    # c_master.objective.set_linear(tup)
+    if write_lp:
+        master.write("almost.lp")  # the LP files are slow to write, they are only needed to debug the model
+
+    # set a reasonable time limit for the solution time of the integer model (in seconds)
+    # (hey we are not getting any younger over here)
+    # in anytime mode the MIP gets the rest of the deadline and the incumbent stands in when it finds nothing better
+    started = time.time()
+    if incumbent is None:
+        if not master.solve_integer(max_seconds_of_final):
+            print("Panic: cannot find an integer solution for the master problem")
+            raise SolverError("cannot find an integer solution for the master problem")
+        solved = True
+    else:
+        seconds = clock.mip_seconds(incumbent.offer_seconds)  # the MIP solution is checked and written like the others
+        solved = seconds > 0 and master.solve_integer(seconds)
+    timings["mip"] = time.time() - started
+
+    # the duty (column) of every ride, a partition must cover every ride exactly once
+    if solved:
+        duty, over, under = ride_duties(J, master.columns, master.values())
+        if len(over) or len(under):
+            message = "the integer solution covers {0} rides more than once (first {1}) and misses {2} rides " \
+                "(first {3})".format(len(over), over[:5].tolist(), len(under), under[:5].tolist())
+            print("Panic: " + message)
+            if incumbent is None:
+                raise SolverError(message)
+        elif incumbent is not None:
+            incumbent.offer(duty, "mip")
+    objective = master.objective_value() if solved else None
+    if incumbent is not None:
+        if incumbent.duty is None:
+            print("Panic: no solution passed the verifier before the deadline")
+            raise SolverError("no solution passed the verifier before the deadline")
+        duty, objective = incumbent.duty, incumbent.value
+        print("Deadline: best solution from the {0} with {1} duties, {2:.1f} seconds left".format(
+            incumbent.source, incumbent.value, clock.remaining()))
+    drivers = np.unique(duty[duty >= 0])
+
+    if write_lp:
+        master.write("myfinal.lp")
+
+    print("_______________________________________________________________________")
+    print("Best integer solution found", objective, "  LP relaxation ", lp_value, "  Lower bound ",
+          stabilizer.bound)
+    print("number of patterns: ", len(drivers))
+
+    # one line per ride, in the order of the input file (the incumbent is in the output file already)
+    if incumbent is None:
+        with open(output_file, "w") as csvfile:  # text mode, python 3 has no csv on binary files
+            writer = csv.writer(csvfile, lineterminator="\n")
+            writer.writerows([d] for d in duty.tolist())
+
+    stats = {"output_file": output_file, "rides": J, "iterations": count, "columns": master.num_columns(),
+             "lp_bound": lp_value, "objective": objective, "duties": len(drivers), "timings": timings,
+             "mip_gap": mip_gap(objective, lp_value), "columns_removed": len(pool.inactive),
+             "lower_bound": stabilizer.bound, "stop_reason": stop_reason}
+    telemetry.summary(**stats)
+    return stats
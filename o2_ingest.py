@@ -0,0 +1,115 @@
+# -------------------------------------------------------------------------------
+# Name:        Streaming timetable reader for the O^2 Challenge
+#
+# The input file is read chunk_size rides at a time. Every chunk is checked and
+# converted to compact arrays before the next one is read, so the raw text in
+# memory never exceeds one chunk however long the timetable is. A bad line
+# raises TimetableError with its line number instead of printing a panic.
+# -------------------------------------------------------------------------------
+
+import csv
+import numpy as np
+from o2_timetable import EVENT_TYPES, TripTable, parse_times
+
+NUM_FIELDS = 9
+CHUNK_SIZE = 1 << 16
+
+# fields of an input line
+iDutyId, iVehicleId, iEventType, iDepartureTime, iArrivalTime, iOriginStopId, iOriginStopName, \
+    iDestinationStopId, iDestinationStopName = range(NUM_FIELDS)
+
+
+class TimetableError(ValueError):
+    """A line of the timetable that cannot be read."""
+
+    def __init__(self, filename, line_number, message):
+        ValueError.__init__(self, "{0}, line {1}: {2}".format(filename, line_number, message))
+        self.filename = filename
+        self.line_number = line_number
+
+
+def read_chunks(filename, chunk_size=CHUNK_SIZE):
+    """Yield (line numbers, rows) of at most chunk_size rides. The header line and empty lines are skipped."""
+    with open(filename) as f:
+        rows = csv.reader(f)
+        next(rows, None)
+        line_numbers, chunk = [], []
+        for row in rows:
+            if not row:
+                continue
+            if len(row) != NUM_FIELDS:
+                raise TimetableError(filename, rows.line_num, "expected {0} fields, got {1}".format(
+                    NUM_FIELDS, len(row)))
+            line_numbers.append(rows.line_num)
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield line_numbers, chunk
+                line_numbers, chunk = [], []
+        if chunk:
+            yield line_numbers, chunk
+
+
+def _times(filename, line_numbers, chunk, field):
+    try:
+        return parse_times([row[field] for row in chunk])
+    except ValueError:
+        # look for the bad line only when there is one
+        for line_number, row in zip(line_numbers, chunk):
+            try:
+                parse_times([row[field]])
+            except ValueError as e:
+                raise TimetableError(filename, line_number, str(e))
+        raise
+
+
+def _stops(filename, line_numbers, chunk, field):
+    try:
+        return np.array([int(row[field]) for row in chunk], dtype=np.int32)
+    except ValueError:
+        for line_number, row in zip(line_numbers, chunk):
+            try:
+                int(row[field])
+            except ValueError:
+                raise TimetableError(filename, line_number, "illegal stop id '{0}'".format(row[field]))
+        raise
+
+
+def read_trips(filename, chunk_size=CHUNK_SIZE):
+    """Read a timetable file into a TripTable, rides keep the order of the file."""
+    bus_codes = {}
+    bus_names = []
+    columns = dict((name, []) for name in ["bus", "event", "start_time", "end_time", "start_location", "end_location"])
+
+    for line_numbers, chunk in read_chunks(filename, chunk_size):
+        bus = np.empty(len(chunk), dtype=np.int32)
+        event = np.empty(len(chunk), dtype=np.int8)
+        for k, row in enumerate(chunk):
+            name = row[iVehicleId]
+            if name not in bus_codes:
+                bus_codes[name] = len(bus_names)
+                bus_names.append(name)
+            bus[k] = bus_codes[name]
+            try:
+                event[k] = EVENT_TYPES.index(row[iEventType])
+            except ValueError:
+                raise TimetableError(filename, line_numbers[k], "unknown event type '{0}'".format(row[iEventType]))
+
+        start_time = _times(filename, line_numbers, chunk, iDepartureTime)
+        end_time = _times(filename, line_numbers, chunk, iArrivalTime)
+        backwards = np.flatnonzero(end_time < start_time)
+        if len(backwards):
+            row = chunk[backwards[0]]
+            raise TimetableError(filename, line_numbers[backwards[0]], "arrival {0} before departure {1}".format(
+                row[iArrivalTime], row[iDepartureTime]))
+
+        columns["bus"].append(bus)
+        columns["event"].append(event)
+        columns["start_time"].append(start_time)
+        columns["end_time"].append(end_time)
+        columns["start_location"].append(_stops(filename, line_numbers, chunk, iOriginStopId))
+        columns["end_location"].append(_stops(filename, line_numbers, chunk, iDestinationStopId))
+
+    arrays = dict((name, np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32))
+                  for name, parts in columns.items())
+    return TripTable(arrays["bus"], arrays["event"], arrays["start_time"], arrays["end_time"],
+                     arrays["start_location"], arrays["end_location"], bus_names)
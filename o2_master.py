@@ -0,0 +1,282 @@
+# -------------------------------------------------------------------------------
+# Name:        Master problem backends for the O^2 Challenge column generation
+#
+# The restricted master is a set partitioning model: one "= 1" row per ride
+# and one column per duty. Every backend supports the same operations: add
+# and remove columns, solve the LP relaxation and read its duals, then switch
+# all the columns to integer and solve the final model under a time limit.
+#
+#   "cplex" - IBM CPLEX through its Python API (needs a license)
+#   "highs" - HiGHS through highspy, re-solves start from the previous basis
+#   "scipy" - HiGHS through scipy.optimize, every solve starts from scratch
+# -------------------------------------------------------------------------------
+
+import numpy as np
+
+MASTER_BACKENDS = ["cplex", "highs", "scipy"]
+
+
+class MasterProblem(object):
+    """Set partitioning master problem over num_rows rides."""
+
+    def __init__(self, num_rows):
+        self.num_rows = num_rows
+        self.columns = []  # rides covered by every column
+        self.obj = []
+        self.integer = False
+
+    def add_columns(self, columns, obj):
+        columns = [[int(j) for j in column] for column in columns]
+        self.columns += columns
+        self.obj += list(obj)
+        self._add_columns(columns, list(obj))
+
+    def remove_columns(self, indices):
+        # the remaining columns keep their order, and so the indices shift down
+        indices = sorted(set(int(i) for i in indices))
+        removed = set(indices)
+        self.columns = [column for i, column in enumerate(self.columns) if i not in removed]
+        self.obj = [c for i, c in enumerate(self.obj) if i not in removed]
+        self._remove_columns(indices)
+
+    def num_columns(self):
+        return len(self.columns)
+
+    def rows(self):
+        # columns covering every ride, in the order they were added
+        rows = [[] for _ in range(self.num_rows)]
+        for i, column in enumerate(self.columns):
+            for j in column:
+                rows[j].append(i)
+        return rows
+
+    def threads(self, num_threads):
+        pass
+
+    def write(self, filename):
+        # LP format dump of the current model
+        with open(filename, "w") as f:
+            f.write("Minimize\n obj: " + " + ".join("{0} x{1}".format(c, i + 1) for i, c in enumerate(self.obj)))
+            f.write("\nSubject To\n")
+            for j, row in enumerate(self.rows()):
+                f.write(" c{0}: {1} = 1\n".format(j + 1, " + ".join("x{0}".format(i + 1) for i in row)))
+            if self.integer:
+                f.write("Generals\n " + " ".join("x{0}".format(i + 1) for i in range(len(self.columns))) + "\n")
+            f.write("End\n")
+
+    def _add_columns(self, columns, obj):
+        raise NotImplementedError
+
+    def _remove_columns(self, indices):
+        raise NotImplementedError
+
+    def solve(self):
+        # solve the LP relaxation, True if an optimal solution was found
+        raise NotImplementedError
+
+    def objective_value(self):
+        raise NotImplementedError
+
+    def dual_values(self):
+        raise NotImplementedError
+
+    def set_integer(self):
+        # all columns, including the ones added later, become integer
+        self.integer = True
+
+    def solve_integer(self, time_limit):
+        # True if an integer solution was found within time_limit seconds
+        raise NotImplementedError
+
+    def values(self):
+        raise NotImplementedError
+
+
+class CplexMaster(MasterProblem):
+
+    def __init__(self, num_rows, stable=False):
+        import cplex
+        MasterProblem.__init__(self, num_rows)
+
+        # Create a cplex object for the model of the master problem
+        self.c_master = cplex.Cplex()
+
+        # Suppress chater of the solver (can be set to 0,1, or 2)
+        self.c_master.parameters.simplex.display.set(0)
+
+        # Let the solver check model before solving - to be on the safe side
+        # can be set to 0 once we have a stable version
+        if stable:
+            self.c_master.parameters.read.datacheck.set(0)
+        else:
+            self.c_master.parameters.read.datacheck.set(1)
+
+        # lower bounds are set to their default value of 0.0
+        # add a "=" constraint for all journeys, all journeys should be fulfilled once
+        self.c_master.linear_constraints.add(senses="E" * num_rows, rhs=[1] * num_rows)
+
+    def _add_columns(self, columns, obj):
+        self.c_master.variables.add(obj=obj, columns=[[column, [1] * len(column)] for column in columns],
+                                    types="I" * len(columns) if self.integer else "")
+
+    def _remove_columns(self, indices):
+        self.c_master.variables.delete(indices)
+
+    def threads(self, num_threads):
+        self.c_master.parameters.threads.set(num_threads)
+
+    def write(self, filename):
+        self.c_master.write(filename)
+
+    def solve(self):
+        self.c_master.solve()
+        return self.c_master.solution.get_status() == 1  # code for optimal solution found
+
+    def objective_value(self):
+        return self.c_master.solution.get_objective_value()
+
+    def dual_values(self):
+        return self.c_master.solution.get_dual_values()
+
+    def set_integer(self):
+        # change the type of all the variables from continuous (default) to integer
+        MasterProblem.set_integer(self)
+        num = self.c_master.variables.get_num()
+        self.c_master.variables.set_types(list(zip(range(num), "I" * num)))
+
+    def solve_integer(self, time_limit):
+        self.c_master.parameters.timelimit.set(time_limit)
+        self.c_master.solve()
+        return self.c_master.solution.is_primal_feasible()
+
+    def values(self):
+        return self.c_master.solution.get_values()
+
+
+class HighsMaster(MasterProblem):
+
+    def __init__(self, num_rows):
+        import highspy
+        MasterProblem.__init__(self, num_rows)
+        self.highspy = highspy
+
+        self.h = highspy.Highs()
+        self.h.setOptionValue("output_flag", False)
+        ones = np.ones(num_rows)
+        self.h.addRows(num_rows, ones, ones, 0, np.zeros(num_rows, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                       np.zeros(0))
+
+    def _add_columns(self, columns, obj):
+        # new columns are nonbasic at 0, the next run starts from the current basis
+        starts = np.cumsum([0] + [len(column) for column in columns[:-1]]).astype(np.int32)
+        index = np.array([j for column in columns for j in column], dtype=np.int32)
+        self.h.addCols(len(columns), np.array(obj, dtype=np.float64), np.zeros(len(columns)),
+                       np.full(len(columns), self.highspy.kHighsInf), len(index), starts, index, np.ones(len(index)))
+        if self.integer:
+            self._set_integrality(range(len(self.columns) - len(columns), len(self.columns)))
+
+    def _remove_columns(self, indices):
+        self.h.deleteCols(len(indices), np.array(indices, dtype=np.int32))
+
+    def threads(self, num_threads):
+        self.h.setOptionValue("threads", num_threads)
+
+    def write(self, filename):
+        self.h.writeModel(filename)
+
+    def solve(self):
+        self.h.run()
+        return self.h.getModelStatus() == self.highspy.HighsModelStatus.kOptimal
+
+    def objective_value(self):
+        return self.h.getInfo().objective_function_value
+
+    def dual_values(self):
+        return list(self.h.getSolution().row_dual)
+
+    def _set_integrality(self, indices):
+        indices = np.array(indices, dtype=np.int32)
+        self.h.changeColsIntegrality(len(indices), indices,
+                                     np.array([self.highspy.HighsVarType.kInteger] * len(indices)))
+
+    def set_integer(self):
+        MasterProblem.set_integer(self)
+        self._set_integrality(range(len(self.columns)))
+
+    def solve_integer(self, time_limit):
+        self.h.setOptionValue("time_limit", float(time_limit))
+        self.h.run()
+        return self.h.getInfo().primal_solution_status == 2  # kSolutionStatusFeasible
+
+    def values(self):
+        return list(self.h.getSolution().col_value)
+
+
+class ScipyMaster(MasterProblem):
+
+    def __init__(self, num_rows):
+        from scipy import optimize, sparse
+        MasterProblem.__init__(self, num_rows)
+        self.optimize = optimize
+        self.sparse = sparse
+        self.result = None
+
+    def _add_columns(self, columns, obj):
+        pass
+
+    def _remove_columns(self, indices):
+        pass
+
+    def _matrix(self):
+        index = np.array([j for column in self.columns for j in column], dtype=np.int64)
+        starts = np.cumsum([0] + [len(column) for column in self.columns])
+        return self.sparse.csc_matrix((np.ones(len(index)), index, starts), shape=(self.num_rows, len(self.columns)))
+
+    def solve(self):
+        self.result = self.optimize.linprog(self.obj, A_eq=self._matrix(), b_eq=np.ones(self.num_rows),
+                                            bounds=(0, None), method="highs")
+        return self.result.status == 0
+
+    def objective_value(self):
+        return self.result.fun
+
+    def dual_values(self):
+        return list(self.result.eqlin.marginals)
+
+    def solve_integer(self, time_limit):
+        self.result = self.optimize.milp(self.obj, integrality=np.ones(len(self.columns)),
+                                         bounds=self.optimize.Bounds(0, np.inf),
+                                         constraints=self.optimize.LinearConstraint(self._matrix(), 1, 1),
+                                         options={"time_limit": time_limit})
+        return self.result.x is not None
+
+    def values(self):
+        return list(self.result.x)
+
+
+def make_master(backend, num_rows, stable=False):
+    if backend == "cplex":
+        return CplexMaster(num_rows, stable)
+    if backend == "highs":
+        return HighsMaster(num_rows)
+    if backend == "scipy":
+        return ScipyMaster(num_rows)
+    raise ValueError("unknown master backend {0!r}, expected one of {1}".format(backend, MASTER_BACKENDS))
+
+
+def ride_duties(num_rows, columns, x, tolerance=1e-6):
+    """The selected column covering every ride, in one pass over the columns with x > tolerance.
+
+    Returns (duty, over, under): duty[j] is the first selected column that covers ride j, -1 if none,
+    over and under are the rides covered more than once and not at all.
+    """
+    selected = np.flatnonzero(np.asarray(x, dtype=np.float64) > tolerance)
+    lengths = np.array([len(columns[i]) for i in selected], dtype=np.int64)
+    rides = np.fromiter((j for i in selected for j in columns[i]), dtype=np.int64, count=int(lengths.sum()))
+    owners = np.repeat(selected, lengths)
+
+    duty = np.full(num_rows, -1, dtype=np.int64)
+    covered, first = np.unique(rides, return_index=True)  # the first column of every ride, columns in order
+    duty[covered] = owners[first]
+    count = np.bincount(rides, minlength=num_rows)
+    return duty, np.flatnonzero(count > 1), np.flatnonzero(count == 0)
@@ -0,0 +1,443 @@
+# -------------------------------------------------------------------------------
+# Name:        Pricing sub problem for the O^2 Challenge column generation
+#
+# Finds the duty (path of rides) with the largest sum of duals that respects
+# the 9 hours duty limit and the 4 hours without a 30 minutes break limit.
+# The labels are computed backwards along every bus block by compiled kernels
+# that only see flat arrays.
+#
+# A duty may change vehicles up to max_switches times. The graph is never
+# copied: a label belongs to a (ride, level) pair, level being the number of
+# changeovers made so far, and node = level * num_trips + ride. A same-bus arc
+# stays on its level and a changeover arc goes one level down, so all labels
+# of level + 1 are computed before the ones of level.
+#
+# One label per node makes the pricing a heuristic under the duty time and
+# break rules: the best shift from a ride may need a start the label did not
+# keep. Lower bounds need the value of the best duty, best_value finds it by
+# going forward from every start with all the labels (start of the part since
+# the last break, value) no other label at the same node beats.
+# -------------------------------------------------------------------------------
+
+from collections import OrderedDict
+import ctypes
+import multiprocessing
+import multiprocessing.sharedctypes
+import numpy as np
+from numba import njit
+from o2_timetable import TARGET, Successors
+
+MAX_DUTY_TIME = 9 * 60
+MAX_TIME_WITHOUT_BREAK = 4 * 60
+MIN_BREAK_TIME = 30
+
+
+@njit(cache=True)
+def _update_labels(order, num_trips, num_levels, terminal, start_time, end_time, indptr, indices,
+                   changeover_indptr, changeover_indices, weight,
+                   S_end_time, S_time_of_beginning_of_break, S_price, S_neighbor):
+    # order lists every node after all of its successors, the trip arrays are indexed by ride
+    for i in order:
+        level = i // num_trips
+        ride = i - level * num_trips
+        max_neighbor = TARGET
+        max_end_time = end_time[ride]
+        max_break = end_time[ride]
+        max_price = -np.inf
+
+        if not terminal[ride]:
+            # the next rides of the same bus, then the changeovers while the duty may still switch
+            for switch in range(2 if level + 1 < num_levels else 1):
+                ptr = indptr if switch == 0 else changeover_indptr
+                successors = indices if switch == 0 else changeover_indices
+                offset = (level + switch) * num_trips
+                for k in range(ptr[ride], ptr[ride + 1]):
+                    next_ride = successors[k]
+                    j = offset + next_ride
+                    if S_end_time[j] - start_time[ride] > MAX_DUTY_TIME:
+                        continue
+
+                    # there is a break of 30 min
+                    if start_time[next_ride] - end_time[ride] >= MIN_BREAK_TIME:
+                        brk = end_time[ride]
+                    # check we have time to take the current ride
+                    elif S_time_of_beginning_of_break[j] - start_time[ride] < MAX_TIME_WITHOUT_BREAK:
+                        brk = S_time_of_beginning_of_break[j]
+                    else:
+                        continue
+
+                    price = S_price[j] + weight[next_ride]
+                    if price > max_price:
+                        max_neighbor = j
+                        max_end_time = S_end_time[j]
+                        max_break = brk
+                        max_price = price
+
+        # ending the shift here is worth 0, a successor wins ties
+        if max_price < 0:
+            max_neighbor = TARGET
+            max_end_time = end_time[ride]
+            max_break = end_time[ride]
+            max_price = 0.0
+
+        S_end_time[i] = max_end_time
+        S_time_of_beginning_of_break[i] = max_break
+        S_price[i] = max_price
+        S_neighbor[i] = max_neighbor
+
+
+@njit(cache=True)
+def _add_label(node, start, value, head, label_start, label_value, label_next, used):
+    # keep the label (start of the part of the duty since the last break, value) at node unless a label there
+    # started its part no earlier and is worth no less, and drop the labels it beats.
+    # returns the number of labels in use, -1 when there is no room for another one
+    previous = -1
+    k = head[node]
+    while k >= 0:
+        if label_start[k] >= start and label_value[k] >= value:
+            return used
+        if label_start[k] <= start and label_value[k] <= value:
+            if previous < 0:
+                head[node] = label_next[k]
+            else:
+                label_next[previous] = label_next[k]
+        else:
+            previous = k
+        k = label_next[k]
+    if used == len(label_start):
+        return -1
+    label_start[used] = start
+    label_value[used] = value
+    label_next[used] = head[node]
+    head[node] = used
+    return used + 1
+
+
+@njit(cache=True)
+def _best_value(rank, num_trips, num_levels, terminal, start_time, end_time, indptr, indices, changeover_indptr,
+                changeover_indices, weight, seen, nodes, head, label_start, label_value, label_next):
+    # value of the best duty from any first level ride, with every label that may still lead to it.
+    # rank orders the nodes after all of their predecessors, the other arrays after weight are scratch.
+    # returns -inf when the label arrays are too small
+    best = -np.inf
+    for first in range(num_trips):
+        limit = start_time[first] + MAX_DUTY_TIME
+
+        # the nodes a duty starting at first can reach within the duty time
+        nodes[0] = first
+        seen[first] = True
+        count = 1
+        k = 0
+        while k < count:
+            i = nodes[k]
+            k += 1
+            level = i // num_trips
+            ride = i - level * num_trips
+            if terminal[ride]:
+                continue
+            for switch in range(2 if level + 1 < num_levels else 1):
+                ptr = indptr if switch == 0 else changeover_indptr
+                successors = indices if switch == 0 else changeover_indices
+                offset = (level + switch) * num_trips
+                for a in range(ptr[ride], ptr[ride + 1]):
+                    j = offset + successors[a]
+                    if end_time[successors[a]] <= limit and not seen[j]:
+                        seen[j] = True
+                        nodes[count] = j
+                        count += 1
+
+        # labels forward over them, in an order of the graph
+        reached = nodes[:count][np.argsort(rank[nodes[:count]])]
+        used = _add_label(first, start_time[first], weight[first], head, label_start, label_value, label_next, 0)
+        for i in reached:
+            level = i // num_trips
+            ride = i - level * num_trips
+            k = head[i]
+            while k >= 0 and used >= 0:
+                if label_value[k] > best:
+                    best = label_value[k]
+                for switch in range(0 if terminal[ride] else (2 if level + 1 < num_levels else 1)):
+                    ptr = indptr if switch == 0 else changeover_indptr
+                    successors = indices if switch == 0 else changeover_indices
+                    offset = (level + switch) * num_trips
+                    for a in range(ptr[ride], ptr[ride + 1]):
+                        next_ride = successors[a]
+                        j = offset + next_ride
+                        if not seen[j]:
+                            continue
+                        # there is a break of 30 min, or the part since the last one stays under 4 hours
+                        if start_time[next_ride] - end_time[ride] >= MIN_BREAK_TIME:
+                            start = start_time[next_ride]
+                        elif end_time[next_ride] - label_start[k] < MAX_TIME_WITHOUT_BREAK:
+                            start = label_start[k]
+                        else:
+                            continue
+                        used = _add_label(j, start, label_value[k] + weight[next_ride], head, label_start,
+                                          label_value, label_next, used)
+                        if used < 0:
+                            break
+                    if used < 0:
+                        break
+                k = label_next[k]
+
+        for i in reached:
+            seen[i] = False
+            head[i] = -1
+        if used < 0:
+            return -np.inf
+    return best
+
+
+@njit(cache=True)
+def _best_start(nodes, start_time, weight, S_end_time, S_price):
+    max_value = -np.inf
+    for i in nodes:
+        if S_price[i] + weight[i] > max_value:
+            max_value = S_price[i] + weight[i]
+
+    # the shortest of the best shifts, the last one on ties
+    best = -1
+    min_duration = MAX_DUTY_TIME
+    for i in nodes:
+        if S_price[i] + weight[i] == max_value and S_end_time[i] - start_time[i] <= min_duration:
+            min_duration = S_end_time[i] - start_time[i]
+            best = i
+    return max_value, best
+
+
+@njit(cache=True)
+def _best_start_per_block(block_ptr, block_nodes, start_time, weight, S_end_time, S_price):
+    num_blocks = len(block_ptr) - 1
+    values = np.empty(num_blocks)
+    best = np.empty(num_blocks, dtype=np.int64)
+    for b in range(num_blocks):
+        values[b], best[b] = _best_start(block_nodes[block_ptr[b]:block_ptr[b + 1]], start_time, weight,
+                                         S_end_time, S_price)
+    return values, best
+
+
+@njit(cache=True)
+def _trace(first, S_neighbor):
+    length = 1
+    i = first
+    while S_neighbor[i] != TARGET:
+        i = S_neighbor[i]
+        length += 1
+
+    path = np.empty(length, dtype=np.int64)
+    path[0] = first
+    for k in range(1, length):
+        path[k] = S_neighbor[path[k - 1]]
+    return path
+
+
+class Pricer(object):
+    """Pricing engine over a trip table and its successor index of same-bus connections.
+
+    With max_switches > 0 a duty may also change vehicles along the arcs of changeovers, at most max_switches times.
+    """
+
+    def __init__(self, trips, successors, bus_to_nodes, changeovers=None, max_switches=0, incremental=True):
+        self.num_trips = len(trips)
+        self.num_levels = max_switches + 1 if changeovers is not None else 1
+        num_nodes = self.num_levels * self.num_trips
+
+        self.start_time = trips.start_time.astype(np.int64)
+        self.end_time = trips.end_time.astype(np.int64)
+        self.indptr = successors.indptr
+        self.indices = successors.indices.astype(np.int64)
+        if changeovers is None:
+            changeovers = Successors(np.zeros(self.num_trips + 1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+        self.changeover_indptr = changeovers.indptr
+        self.changeover_indices = changeovers.indices.astype(np.int64)
+
+        # first level rides of every bus, shifts may begin at any of them
+        self.starts = np.arange(self.num_trips, dtype=np.int64)
+        self.block_nodes = np.array([u for bus in bus_to_nodes for u in bus_to_nodes[bus]], dtype=np.int64)
+        self.block_ptr = np.cumsum([0] + [len(bus_to_nodes[bus]) for bus in bus_to_nodes]).astype(np.int64)
+
+        # highest level first, every bus block backwards. the last ride of each bus is the end of all shifts
+        # a unit is one bus block on one level, unit = level * num_blocks + block
+        num_blocks = len(bus_to_nodes)
+        self.terminal = np.zeros(self.num_trips, dtype=np.bool_)
+        self.terminal[self.block_nodes[self.block_ptr[1:][np.diff(self.block_ptr) > 0] - 1]] = True
+        block_order = np.concatenate([self.block_nodes[self.block_ptr[b]:self.block_ptr[b + 1]][::-1]
+                                      for b in range(num_blocks)] or [np.zeros(0, dtype=np.int64)])
+        levels = np.arange(self.num_levels - 1, -1, -1, dtype=np.int64)
+        self.order = (levels[:, None] * self.num_trips + block_order).reshape(-1)
+
+        # the labels of a unit depend only on the duals of its bus and on the labels of the units it has arcs into,
+        # which always come earlier in order. when only some duals move, only the units that see them are updated
+        self.incremental = incremental
+        self.num_blocks = num_blocks
+        self.block_of_trip = np.empty(self.num_trips, dtype=np.int64)
+        self.block_of_trip[self.block_nodes] = np.repeat(np.arange(num_blocks), np.diff(self.block_ptr))
+        self.order_unit = self.units(self.order)
+        self.unit_order = list(OrderedDict.fromkeys(self.order_unit.tolist()))
+        # same-bus arcs stay in their unit, a changeover joins a block to another block one level down
+        from_nodes, to_nodes = changeovers.arcs()
+        block_pairs = set(zip(self.block_of_trip[from_nodes].tolist(), self.block_of_trip[to_nodes].tolist()))
+        self.unit_deps = [[] for _ in range(self.num_levels * num_blocks)]
+        for level in range(self.num_levels - 1):
+            for from_block, to_block in block_pairs:
+                self.unit_deps[level * num_blocks + from_block].append((level + 1) * num_blocks + to_block)
+        self.last_y = None
+        self.num_updated = 0  # nodes whose labels were recomputed by the last call
+
+        # the labels of every (ride, level) node
+        self.weight = np.zeros(self.num_trips)  # dual of every ride, the weight of every arc entering it
+        self.S_end_time = np.zeros(num_nodes, dtype=np.int64)
+        self.S_time_of_beginning_of_break = np.zeros(num_nodes, dtype=np.int64)
+        self.S_price = np.zeros(num_nodes)
+        self.S_neighbor = np.full(num_nodes, TARGET, dtype=np.int64)
+        # scratch of best_value, rank puts every node after the ones with arcs into it
+        self.rank = np.empty(num_nodes, dtype=np.int64)
+        self.rank[self.order[::-1]] = np.arange(num_nodes)
+        self.B_seen = np.zeros(num_nodes, dtype=np.bool_)
+        self.B_nodes = np.empty(num_nodes, dtype=np.int64)
+        self.B_head = np.full(num_nodes, -1, dtype=np.int64)
+        self._labels(4 * num_nodes)
+
+    def units(self, nodes):
+        # unit of every node
+        return nodes // self.num_trips * self.num_blocks + self.block_of_trip[nodes % self.num_trips]
+
+    def update_labels(self, order):
+        _update_labels(order, self.num_trips, self.num_levels, self.terminal, self.start_time, self.end_time,
+                       self.indptr, self.indices, self.changeover_indptr, self.changeover_indices, self.weight,
+                       self.S_end_time, self.S_time_of_beginning_of_break, self.S_price, self.S_neighbor)
+
+    def close(self):
+        pass
+
+    def _labels(self, size):
+        self.B_label_start = np.empty(size, dtype=np.int64)
+        self.B_label_value = np.empty(size)
+        self.B_label_next = np.empty(size, dtype=np.int64)
+
+    def best_value(self, y):
+        """Value of the best duty for the duals y. Unlike max_value of get_shifts it is exact, for Farley bounds."""
+        y = np.asarray(y, dtype=np.float64)
+        while True:
+            value = _best_value(self.rank, self.num_trips, self.num_levels, self.terminal, self.start_time,
+                                self.end_time, self.indptr, self.indices, self.changeover_indptr,
+                                self.changeover_indices, y, self.B_seen, self.B_nodes, self.B_head,
+                                self.B_label_start, self.B_label_value, self.B_label_next)
+            if value > -np.inf or self.num_trips == 0:
+                return float(value)
+            self._labels(2 * len(self.B_label_start))  # out of labels, try again with twice as many
+
+    def get_shifts(self, y, k=1, min_value=-np.inf):
+        # the best shift and up to k - 1 more worth more than min_value, at most one starting in each bus block
+        # the (ride, level) nodes of a ride share its dual
+        y = np.asarray(y, dtype=np.float64)
+        self.weight[:] = y
+
+        order = self.order
+        if self.incremental and self.last_y is not None:
+            moved = np.zeros(self.num_blocks, dtype=np.bool_)
+            moved[self.block_of_trip[y != self.last_y]] = True
+            dirty = np.tile(moved, self.num_levels)
+            for unit in self.unit_order:
+                if not dirty[unit]:
+                    dirty[unit] = any(dirty[other] for other in self.unit_deps[unit])
+            order = order[dirty[self.order_unit]]
+        self.last_y = y.copy()
+        self.num_updated = len(order)
+
+        self.update_labels(order)
+
+        # every first level ride may begin a shift
+        max_value, best = _best_start(self.starts, self.start_time, self.weight, self.S_end_time, self.S_price)
+        path = [-1] if best < 0 else _trace(best, self.S_neighbor).tolist()
+        paths, values = [path], [float(max_value)]
+
+        if k > 1 and best >= 0:
+            block_values, block_best = _best_start_per_block(self.block_ptr, self.block_nodes, self.start_time,
+                                                             self.weight, self.S_end_time, self.S_price)
+            rides = [frozenset(j % self.num_trips for j in path)]
+            for b in np.argsort(-block_values, kind="mergesort"):
+                if len(paths) >= k or not block_values[b] > min_value:
+                    break
+                if block_best[b] < 0 or block_best[b] == best:
+                    continue
+
+                # skip shifts whose rides are all covered by a shift we already took
+                block_path = _trace(block_best[b], self.S_neighbor).tolist()
+                block_rides = frozenset(j % self.num_trips for j in block_path)
+                if any(block_rides <= other for other in rides):
+                    continue
+                rides.append(block_rides)
+                paths.append(block_path)
+                values.append(float(block_values[b]))
+
+        return {"max_value": float(max_value), "path": path, "paths": paths, "values": values}
+
+
+# arrays a pricing worker process sees, filled by _init_worker
+_shared = {}
+_SHARED_ARRAYS = ["terminal", "start_time", "end_time", "indptr", "indices", "changeover_indptr", "changeover_indices",
+                  "weight", "S_end_time", "S_time_of_beginning_of_break", "S_price", "S_neighbor"]
+
+
+def _init_worker(buffers, num_trips, num_levels):
+    for name, (buf, dtype, size) in buffers.items():
+        _shared[name] = np.frombuffer(buf, dtype=dtype)[:size]
+    _shared["num_trips"], _shared["num_levels"] = num_trips, num_levels
+
+
+def _update_chunk(nodes):
+    _update_labels(nodes, _shared["num_trips"], _shared["num_levels"], _shared["terminal"], _shared["start_time"],
+                   _shared["end_time"], _shared["indptr"], _shared["indices"], _shared["changeover_indptr"],
+                   _shared["changeover_indices"], _shared["weight"], _shared["S_end_time"],
+                   _shared["S_time_of_beginning_of_break"], _shared["S_price"], _shared["S_neighbor"])
+    return len(nodes)
+
+
+class ParallelPricer(Pricer):
+    """Pricer that spreads the bus blocks of every level over a pool of worker processes.
+
+    The trip arrays, duals and labels live in shared memory. Workers write the labels of their
+    blocks in place, levels are done one after the other since a level reads the next one.
+    """
+
+    def __init__(self, trips, successors, bus_to_nodes, processes, changeovers=None, max_switches=0,
+                 incremental=True):
+        Pricer.__init__(self, trips, successors, bus_to_nodes, changeovers, max_switches, incremental)
+        self.processes = processes
+
+        buffers = {}
+        for name in _SHARED_ARRAYS:
+            array = getattr(self, name)
+            # an empty array (no changeovers) still gets one element, a buffer of 0 bytes cannot be shared
+            buf = multiprocessing.sharedctypes.RawArray(ctypes.c_byte, max(array.nbytes, array.itemsize))
+            shared = np.frombuffer(buf, dtype=array.dtype)[:array.size]
+            shared[:] = array
+            setattr(self, name, shared)
+            buffers[name] = (buf, array.dtype, array.size)
+
+        self.pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                         initargs=(buffers, self.num_trips, self.num_levels))
+
+    def update_labels(self, order):
+        if len(order) == 0:
+            return
+
+        levels = order // self.num_trips
+        units = self.units(order)
+        for level in reversed(range(self.num_levels)):
+            level_order = order[levels == level]
+            if len(level_order) == 0:
+                continue
+
+            # cut the level into about one chunk per process, never inside a bus block
+            unit_starts = np.flatnonzero(np.diff(units[levels == level])) + 1
+            cuts = []
+            if len(unit_starts):
+                targets = np.arange(1, self.processes) * len(level_order) // self.processes
+                cuts = np.unique(unit_starts[np.minimum(np.searchsorted(unit_starts, targets), len(unit_starts) - 1)])
+            self.pool.map(_update_chunk, np.split(level_order, cuts))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,83 @@
+# -------------------------------------------------------------------------------
+# Name:        Dual stabilization for the O^2 Challenge column generation
+#
+# Wentges smoothing: the sub problem is solved at a convex combination of the
+# current master duals and the stability center (the duals with the best
+# lower bound so far). A column that is not improving for the master duals
+# is a mis-pricing, then the duals are moved towards the master duals until
+# alpha reaches 0 and plain pricing either finds a column or proves optimality.
+#
+# The pricing is a heuristic, so the bound from its best value is an estimate
+# that may be too high. It is good enough to pick the stability center. A valid
+# bound needs the exact value of the best duty (see o2_pricing), which costs
+# far more than the pricing: with exact it is computed once per call, at the
+# duals of the shifts returned, and otherwise only when bound_at is called.
+# -------------------------------------------------------------------------------
+
+import numpy as np
+
+
+def farley_bound(y, max_value):
+    # all columns cost 1, so y / max_value is dual feasible and its objective bounds the master LP from below,
+    # as long as no duty is worth more than max_value for the duals y
+    if max_value <= 0:
+        return -np.inf
+    return float(np.sum(y)) / max_value
+
+
+class DualSmoothing(object):
+    """Wentges dual smoothing around the best bound duals, alpha = 0 is plain pricing.
+
+    exact: keep a valid lower bound up to date on every call, for the stopping rules that need one.
+    """
+
+    def __init__(self, alpha=0.0, exact=False):
+        self.alpha = alpha
+        self.exact = exact
+        self.center = None
+        self.estimate = -np.inf  # best bound from the values of the pricing so far, found at self.center
+        self.bound = -np.inf  # best valid lower bound so far
+        self.mispricings = 0  # of the last call
+
+    def bound_at(self, pricer, y):
+        """The best valid lower bound so far, after the one of the duals y."""
+        self.bound = max(self.bound, farley_bound(y, pricer.best_value(y)))
+        return self.bound
+
+    def get_shifts(self, pricer, y, k=1, min_value=-np.inf):
+        y = np.asarray(y, dtype=np.float64)
+        self.mispricings = 0
+
+        while True:
+            alpha = max(0.0, 1 - (self.mispricings + 1) * (1 - self.alpha)) if self.center is not None else 0.0
+            y_sep = y if alpha == 0 else alpha * self.center + (1 - alpha) * y
+            shifts = pricer.get_shifts(y_sep, k, -np.inf if alpha > 0 else min_value)
+
+            estimate = farley_bound(y_sep, shifts["max_value"])
+            if estimate > self.estimate:
+                self.estimate = estimate
+                self.center = y_sep.copy()
+
+            if alpha == 0:
+                if self.exact:
+                    self.bound_at(pricer, y_sep)
+                shifts["alpha"] = alpha
+                shifts["bound"] = self.bound
+                return shifts
+
+            # keep the shifts that improve the master for its own duals
+            paths, values = [], []
+            for path in shifts["paths"]:
+                value = float(y[np.array(path) % pricer.num_trips].sum())
+                if value > min_value:
+                    paths.append(path)
+                    values.append(value)
+
+            if paths:
+                if self.exact:
+                    self.bound_at(pricer, y_sep)
+                best = int(np.argmax(values))
+                return {"max_value": values[best], "path": paths[best], "paths": paths, "values": values,
+                        "alpha": alpha, "bound": self.bound}
+
+            self.mispricings += 1
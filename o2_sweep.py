@@ -0,0 +1,171 @@
+# -------------------------------------------------------------------------------
+# Name:        Parameter sweeps of the O^2 Challenge column generation
+#
+# run_sweep solves one timetable under every configuration of a grid, several
+# configurations at a time on a pool of worker processes. The timetable is
+# parsed once into the cache before the workers start, they memory-map the
+# same arrays (see o2_cache). Every worker caps the threads of its LP / MIP
+# solver so the runs side by side do not fight over the cores. Every solution
+# is checked by the verifier and the runs are summed up in one table of
+# duties, secondary objective, LP bound and wall time, also kept as CSV. With
+# component_processes every configuration solves the independent parts of the
+# timetable one by one or side by side instead (see o2_decompose).
+#
+# Usage: python o2_sweep.py --max-iter 1000 2000 --max-car-num 1 2 --processes 4
+# -------------------------------------------------------------------------------
+
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+from o2_decompose import run_components
+from o2_engine import O2Parser, run
+from o2_telemetry import Telemetry
+from o2_verifier import MAX_CHANGEOVERS, read_solution, verify
+from o2_worker import call_logged
+
+SUMMARY_FIELDS = ["name", "duties", "total_time", "lp_bound", "lower_bound", "objective", "wall_time", "verified",
+                  "iterations", "stop_reason", "output_file"]
+
+
+def grid(**axes):
+    """Every combination of the values of axes, as dicts of run() arguments. The last axis by name changes fastest."""
+    names = sorted(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*[axes[name] for name in names])]
+
+
+def config_name(config):
+    # the name results/ already uses, the other arguments of the grid follow
+    name = "{0}cars_max_iter{1}_maxtime{2}".format(config.get("max_switches", 0) + 1, config["max_num_of_iter"],
+                                                   config["max_seconds_of_final"])
+    others = sorted(k for k in config if k not in ("max_switches", "max_num_of_iter", "max_seconds_of_final"))
+    return "_".join([name] + ["{0}{1}".format(k, config[k]) for k in others])
+
+
+def _run_config(job):
+    # worker process: run one configuration in its own directory and verify the solution
+    name, config, input_file, directory, options, component_processes = job
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    kwargs = dict(options)
+    kwargs.update(config)
+    max_num_of_iter, max_seconds_of_final = kwargs.pop("max_num_of_iter"), kwargs.pop("max_seconds_of_final")
+    row = {"name": name}
+
+    started = time.time()
+    output_file_name = os.path.join(directory, name.split("_")[0])
+    if component_processes > 0:
+        # every part keeps its own telemetry in work_dir
+        stats, error = call_logged("run.log", directory, run_components, "o2_engine", max_num_of_iter,
+                                   max_seconds_of_final, input_file, output_file_name, component_processes,
+                                   work_dir=os.path.join(directory, "components"), **kwargs)
+    else:
+        stats, error = call_logged("run.log", directory, run, max_num_of_iter, max_seconds_of_final, input_file,
+                                   output_file_name, telemetry=Telemetry(os.path.join(directory, "telemetry.jsonl")),
+                                   **kwargs)
+    row["wall_time"] = time.time() - started
+    if error is not None:
+        # the other configurations go on
+        row.update({"verified": False, "stop_reason": "failed ({0}), see {1}".format(
+            error, os.path.join(directory, "run.log"))})
+        return row
+
+    max_switches = kwargs.get("max_switches", 0)
+    trips = O2Parser.pars(input_file, max_switches, kwargs.get("changeover_window", (0, 0)),
+                          cache_dir=kwargs.get("cache_dir"))[0]
+    result = verify(trips, read_solution(stats["output_file"]), max(MAX_CHANGEOVERS, max_switches))
+    row.update({"duties": stats["duties"], "total_time": result["total_time"], "lp_bound": stats["lp_bound"],
+                "lower_bound": stats["lower_bound"], "objective": stats["objective"], "verified": result["acceptable"],
+                "iterations": stats["iterations"], "stop_reason": stats["stop_reason"],
+                "output_file": stats["output_file"]})
+    return row
+
+
+def print_summary(rows):
+    print("{0:<48} {1:>6} {2:>10} {3:>10} {4:>9} {5:>8}".format(
+        "configuration", "duties", "secondary", "LP bound", "seconds", "verified"))
+    for row in rows:
+        print("{0:<48} {1:>6} {2:>10} {3:>10} {4:>9.1f} {5:>8}".format(
+            row["name"], row.get("duties", "-"), row.get("total_time", "-"),
+            "-" if row.get("lp_bound") is None else "{0:.2f}".format(row["lp_bound"]), row["wall_time"],
+            "yes" if row["verified"] else "NO"))
+
+
+def run_sweep(input_file_name, configs, processes=1, threads=None, work_dir="sweep", component_processes=0,
+              **options):
+    """Solve input_file_name under every configuration of configs, processes configurations at a time.
+
+    A configuration is a dict of run() arguments with at least max_num_of_iter and max_seconds_of_final,
+    options go to every run(). threads caps the threads of the solver of every run, by default the cores
+    are split between the processes. component_processes > 0 solves every configuration with run_components
+    in that many processes. Returns one summary row per configuration, also written to work_dir/summary.csv.
+    """
+    work_dir = os.path.abspath(work_dir)
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    input_file_name = os.path.abspath(input_file_name)
+    if threads is None:
+        threads = max(multiprocessing.cpu_count() // max(processes, 1), 1)
+    options["solver_threads"] = threads
+    options["cache_dir"] = os.path.abspath(options.get("cache_dir") or os.path.join(work_dir, "cache"))
+    if processes > 1:
+        options["pricing_processes"] = 1  # a worker cannot start a pool of its own
+        component_processes = min(component_processes, 1)
+
+    # parse every graph the configurations need before the workers start, they load it from the cache
+    for graph in set((c.get("max_switches", options.get("max_switches", 0)),
+                      tuple(c.get("changeover_window", options.get("changeover_window", (0, 0))))) for c in configs):
+        O2Parser.pars(input_file_name, graph[0], graph[1], cache_dir=options["cache_dir"])
+
+    names = [config_name(config) for config in configs]
+    jobs = [(name, config, input_file_name, os.path.join(work_dir, name), options, component_processes)
+            for name, config in zip(names, configs)]
+    if processes > 1:
+        pool = multiprocessing.Pool(min(processes, len(jobs)))
+        rows = pool.map(_run_config, jobs, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        rows = [_run_config(job) for job in jobs]
+
+    with open(os.path.join(work_dir, "summary.csv"), "w") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(SUMMARY_FIELDS)
+        writer.writerows([row.get(field, "") for field in SUMMARY_FIELDS] for row in rows)
+    print_summary(rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve a timetable under a grid of configurations.")
+    parser.add_argument("--input", default="large_data_csv.csv")
+    parser.add_argument("--max-iter", nargs="+", type=int, default=[1000])
+    parser.add_argument("--max-seconds-of-final", nargs="+", type=int, default=[300])
+    parser.add_argument("--max-car-num", nargs="+", type=int, default=[1, 2], help="vehicles a driver may use")
+    parser.add_argument("--stable", nargs="+", type=int, default=[0], help="1 skips the model checks of CPLEX")
+    parser.add_argument("--processes", type=int, default=1, help="configurations solved at a time")
+    parser.add_argument("--threads", type=int, default=None, help="solver threads of every run")
+    parser.add_argument("--columns-per-iter", type=int, default=1)
+    parser.add_argument("--dual-smoothing", type=float, default=0.0)
+    parser.add_argument("--max-column-age", type=int, default=0)
+    parser.add_argument("--integer-gap", type=int, default=None)
+    parser.add_argument("--master-backend", default="cplex")
+    parser.add_argument("--deadline", type=float, default=None, help="seconds for every run, see o2_anytime")
+    parser.add_argument("--warm-start", type=int, default=None, help="randomized variants of the initial duties")
+    parser.add_argument("--work-dir", default="sweep", help="a directory per configuration and summary.csv")
+    parser.add_argument("--component-processes", type=int, default=0,
+                        help="> 0 solves the independent parts of the timetable in that many processes")
+    args = parser.parse_args(argv)
+
+    configs = grid(max_num_of_iter=args.max_iter, max_seconds_of_final=args.max_seconds_of_final,
+                   max_switches=[n - 1 for n in args.max_car_num], stable=[bool(s) for s in args.stable])
+    run_sweep(args.input, configs, args.processes, args.threads, args.work_dir, args.component_processes,
+              columns_per_iter=args.columns_per_iter, dual_smoothing=args.dual_smoothing,
+              max_column_age=args.max_column_age, integer_gap=args.integer_gap, master_backend=args.master_backend,
+              deadline=args.deadline, warm_start=args.warm_start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -------------------------------------------------------------------------------
+# Name:        Column generation telemetry for the O^2 Challenge
+#
+# run() reports one record per iteration and a summary at the end. Records are
+# plain dicts, they are appended to a JSON lines file and/or passed to a
+# callback, and a short progress line is printed every print_every iterations.
+# -------------------------------------------------------------------------------
+
+import json
+import os
+import time
+
+
+def memory_in_use():
+    # resident set size in bytes, None where we cannot tell
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, in kilobytes on linux
+    except ImportError:
+        return None
+
+
+def mip_gap(objective, bound):
+    # relative distance of the integer solution from the LP bound
+    if objective is None or bound is None or objective == 0:
+        return None
+    return abs(objective - bound) / abs(objective)
+
+
+class Telemetry(object):
+    """Sink for the iteration and summary records of a column generation run."""
+
+    def __init__(self, log_file=None, callback=None, print_every=0):
+        self.log_file = log_file
+        self.callback = callback
+        self.print_every = print_every
+        self.started = time.time()
+        self.records = 0
+        if log_file is not None:
+            open(log_file, "w").close()
+
+    def _emit(self, record):
+        self.records += 1
+        if self.log_file is not None:
+            with open(self.log_file, "a") as f:
+                f.write(json.dumps(record, sort_keys=True) + "\n")
+        if self.callback is not None:
+            self.callback(record)
+
+    def iteration(self, **fields):
+        record = dict(fields, type="iteration", elapsed=time.time() - self.started, memory=memory_in_use())
+        self._emit(record)
+        if self.print_every and record["iteration"] % self.print_every == 0:
+            print("Iteration {0}: master {1}, best reduced cost {2}, {3} columns, {4:.1f}s".format(
+                record["iteration"], record["master_objective"], record["best_reduced_cost"], record["columns"],
+                record["elapsed"]))
+        return record
+
+    def summary(self, **fields):
+        record = dict(fields, type="summary", elapsed=time.time() - self.started, memory=memory_in_use())
+        self._emit(record)
+        return record
@@ -0,0 +1,61 @@
+# -------------------------------------------------------------------------------
+# Name:        Early termination of the O^2 Challenge column generation
+#
+# Column generation ends by itself when the pricing finds no improving shift.
+# Before that the master value and the Lagrangian (Farley) lower bound of the
+# pricing may be close enough: the objective counts drivers, so once both round
+# up to the same number no more columns can improve the final MIP bound.
+# Termination checks these rules after every pricing round.
+#
+# The pricing keeps one label per ride and may miss the best duty, so the bound
+# divides by the value of the best duty from an exact labelling (see
+# o2_pricing), not by the best value the pricing found.
+# -------------------------------------------------------------------------------
+
+import math
+
+STOP_REASONS = ["optimal", "iterations", "gap", "integer gap", "tailing off", "deadline"]
+
+
+def lp_gap(master_value, bound):
+    # relative distance of the master LP value from the lower bound
+    if bound <= -float("inf"):
+        return float("inf")
+    return max(master_value - bound, 0.0) / max(abs(master_value), 1e-9)
+
+
+def rounded(value):
+    # number of drivers a fractional value stands for
+    return int(math.ceil(value - 1e-6))
+
+
+class Termination(object):
+    """Stopping rules, None disables a rule.
+
+    gap_tolerance: stop when lp_gap(master, bound) <= gap_tolerance.
+    integer_gap: stop when the master value and the bound, rounded up, are at most integer_gap drivers apart.
+    tailing_off: (iterations, improvement), stop when the master value improved by less than the
+        relative improvement over the last iterations.
+    """
+
+    def __init__(self, gap_tolerance=None, integer_gap=None, tailing_off=None):
+        self.gap_tolerance = gap_tolerance
+        self.integer_gap = integer_gap
+        self.tailing_off = tailing_off
+        self.history = []  # master value of every check
+        self.reason = None
+
+    def check(self, master_value, bound):
+        """The reason to stop after a pricing round with this master value and lower bound, None to go on."""
+        self.history.append(master_value)
+
+        if self.gap_tolerance is not None and lp_gap(master_value, bound) <= self.gap_tolerance:
+            self.reason = "gap"
+        elif self.integer_gap is not None and bound > -float("inf") \
+                and rounded(master_value) - rounded(bound) <= self.integer_gap:
+            self.reason = "integer gap"
+        elif self.tailing_off is not None and len(self.history) > self.tailing_off[0]:
+            previous = self.history[-1 - self.tailing_off[0]]
+            if previous - master_value <= self.tailing_off[1] * abs(previous):
+                self.reason = "tailing off"
+        return self.reason
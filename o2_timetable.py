@@ -0,0 +1,194 @@
+# -------------------------------------------------------------------------------
+# Name:        Columnar trip table and successor index for the O^2 Challenge
+#
+# Trips are kept as parallel NumPy arrays (one entry per ride, file order) and
+# the connection graph as CSR successor indexes over ride ids, one for the
+# same-bus connections and one for the changeovers between buses.
+# -------------------------------------------------------------------------------
+
+from collections import OrderedDict
+import numpy as np
+
+EVENT_TYPES = ["service_trip", "depot_pull_in", "depot_pull_out"]
+
+# successor id used for the artificial "target" node
+TARGET = -1
+
+
+class TripTable(object):
+    """Columnar timetable, entry i of every array describes ride i."""
+
+    def __init__(self, bus, event, start_time, end_time, start_location, end_location, bus_names):
+        self.bus = np.asarray(bus, dtype=np.int32)  # index into bus_names
+        self.event = np.asarray(event, dtype=np.int8)  # index into EVENT_TYPES
+        self.start_time = np.asarray(start_time, dtype=np.int32)  # minutes from 0
+        self.end_time = np.asarray(end_time, dtype=np.int32)
+        self.start_location = np.asarray(start_location, dtype=np.int32)
+        self.end_location = np.asarray(end_location, dtype=np.int32)
+        self.bus_names = list(bus_names)  # Vehicle Id strings
+
+    def __len__(self):
+        return len(self.bus)
+
+    @property
+    def duration_time(self):
+        return self.end_time - self.start_time
+
+    @staticmethod
+    def from_columns(bus, event, start_time, end_time, start_location, end_location):
+        # bus is a list of Vehicle Id strings, codes follow order of first appearance
+        bus_codes = OrderedDict()
+        codes = [bus_codes.setdefault(b, len(bus_codes)) for b in bus]
+        return TripTable(codes, event, start_time, end_time, start_location, end_location, bus_codes.keys())
+
+    def block_order(self):
+        # rides sorted by vehicle, then by time (ties keep file order)
+        return np.lexsort((self.end_time, self.start_time, self.bus))
+
+    def bus_to_nodes(self):
+        # Vehicle Id -> rides of that vehicle in time order
+        order = self.block_order()
+        bounds = np.searchsorted(self.bus[order], np.arange(len(self.bus_names) + 1))
+        result = OrderedDict()
+        for code, name in enumerate(self.bus_names):
+            result[name] = order[bounds[code]:bounds[code + 1]].tolist()
+        return result
+
+
+def same_bus_arcs(trips):
+    """Arcs from every ride to the next ride of its vehicle, if a driver can stay on board.
+
+    Returns (from_nodes, to_nodes, num_dropped), num_dropped counts neighbouring rides that
+    cannot be chained because the next ride starts elsewhere or before the previous one ends.
+    """
+    order = trips.block_order()
+    first, second = order[:-1], order[1:]
+    neighbours = trips.bus[first] == trips.bus[second]
+    legal = neighbours & (trips.end_location[first] == trips.start_location[second]) \
+        & (trips.end_time[first] <= trips.start_time[second])
+    return first[legal], second[legal], int(neighbours.sum() - legal.sum())
+
+
+def changeover_arcs(trips, window=(0, 0)):
+    """Arcs from every ride to the rides of other vehicles a driver can change over to.
+
+    A driver arriving at a stop may board another vehicle that departs from the same stop
+    between window[0] and window[1] minutes later. Departures are indexed by (stop, time)
+    so each arrival finds its candidates with a binary search. Raises ValueError when
+    window[0] < 0: the next ride would leave before the driver arrives.
+    """
+    min_wait, max_wait = window
+    if min_wait < 0:
+        raise ValueError("changeover window {0} starts before the arrival, the minimum wait must be >= 0".format(
+            list(window)))
+    if len(trips) == 0 or min_wait > max_wait:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+    # key = stop * span + time, with room for the window so a search never leaves its stop
+    slack = max_wait
+    time_base = min(trips.start_time.min(), trips.end_time.min()) - slack
+    span = max(trips.start_time.max(), trips.end_time.max()) - time_base + slack + 1
+
+    departures = np.argsort(trips.start_location.astype(np.int64) * span + (trips.start_time - time_base),
+                            kind="mergesort")
+    departure_keys = trips.start_location[departures].astype(np.int64) * span \
+        + (trips.start_time[departures] - time_base)
+    arrival_keys = trips.end_location.astype(np.int64) * span + (trips.end_time - time_base)
+
+    first = np.searchsorted(departure_keys, arrival_keys + min_wait, side="left")
+    last = np.searchsorted(departure_keys, arrival_keys + max_wait, side="right")
+    counts = np.maximum(last - first, 0)
+
+    # expand the [first, last) ranges of every arrival
+    from_nodes = np.repeat(np.arange(len(trips), dtype=np.int32), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    to_nodes = departures[np.repeat(first, counts) + offsets]
+
+    other_bus = trips.bus[from_nodes] != trips.bus[to_nodes]
+    return from_nodes[other_bus], to_nodes[other_bus]
+
+
+class Successors(object):
+    """CSR adjacency: the successors of node i are indices[indptr[i]:indptr[i + 1]]."""
+
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+
+    @property
+    def num_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def num_arcs(self):
+        return len(self.indices)
+
+    def __getitem__(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def arcs(self):
+        # (from_nodes, to_nodes) arrays of all arcs
+        return np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.indptr)), self.indices
+
+    @staticmethod
+    def from_arcs(num_nodes, from_nodes, to_nodes):
+        from_nodes = np.asarray(from_nodes, dtype=np.int64)
+        to_nodes = np.asarray(to_nodes, dtype=np.int32)
+        order = np.lexsort((to_nodes, from_nodes))
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(from_nodes, minlength=num_nodes), out=indptr[1:])
+        return Successors(indptr, to_nodes[order])
+
+
+def components(num_trips, successors, changeovers=None):
+    """Component of every ride: two rides can be in one duty only if a chain of arcs joins them.
+
+    Components are numbered in the order of their first ride.
+    """
+    from_nodes, to_nodes = successors.arcs()
+    if changeovers is not None:
+        from_nodes = np.concatenate([from_nodes, changeovers.arcs()[0]])
+        to_nodes = np.concatenate([to_nodes, changeovers.indices])
+    from_nodes = from_nodes.astype(np.int64)
+    to_nodes = to_nodes.astype(np.int64)
+
+    # every ride points at a smaller one, the roots point at themselves. hook the roots of the two ends
+    # of every arc onto the smaller one, then jump pointers until every ride points at its root
+    labels = np.arange(num_trips, dtype=np.int64)
+    while (labels[from_nodes] != labels[to_nodes]).any():
+        low = np.minimum(labels[from_nodes], labels[to_nodes])
+        np.minimum.at(labels, labels[from_nodes], low)
+        np.minimum.at(labels, labels[to_nodes], low)
+        jumped = labels[labels]
+        while (jumped != labels).any():
+            labels, jumped = jumped, jumped[jumped]
+
+    roots, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(roots), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(roots))
+    return rank[inverse.reshape(-1)]
+
+
+def parse_times(column):
+    """Convert a column of "HH:MM:SS" strings to int minutes from 0, hours of 24 and above included."""
+    raw = np.char.strip(np.asarray(column).astype(np.bytes_))
+    if len(raw) == 0:
+        return np.zeros(0, dtype=np.int32)
+
+    text = np.char.rjust(raw, 8, b"0")  # "5:24:00" -> "05:24:00"
+    if text.dtype.itemsize != 8:
+        raise ValueError("illegal time '{0}'".format(max(raw, key=len).decode("ascii", "replace")))
+
+    digits = text.view(np.uint8).reshape(-1, 8).astype(np.int32) - ord("0")
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 3] * 10 + digits[:, 4]
+    seconds = digits[:, 6] * 10 + digits[:, 7]
+
+    numbers = digits[:, [0, 1, 3, 4, 6, 7]]
+    legal = (digits[:, 2] == ord(":") - ord("0")) & (digits[:, 5] == ord(":") - ord("0")) \
+        & (numbers >= 0).all(axis=1) & (numbers <= 9).all(axis=1) & (minutes < 60) & (seconds < 60)
+    if not legal.all():
+        raise ValueError("illegal time '{0}'".format(raw[np.argmin(legal)].decode("ascii", "replace")))
+
+    # seconds are truncated, as the verifier does
+    return (hours * 60 + minutes).astype(np.int32)
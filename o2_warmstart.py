@@ -0,0 +1,82 @@
+# -------------------------------------------------------------------------------
+# Name:        Initial duties for the O^2 Challenge column generation
+#
+# Instead of finding every realistic duty from the single ride columns, the
+# master can start with duties cut from the chains of same-bus rides (the
+# rides of a vehicle joined by the successor index). A chain is cut greedily:
+# every duty takes as many rides as the 9 hours duty limit and the 4 hours
+# without a 30 minutes break limit allow, with the same rules as the pricing.
+# The greedy duties are a partition of the rides, and the randomized variants
+# cut every duty after a random number of rides, between half and all of the
+# ones that fit, so the cuts fall elsewhere along the chain.
+# -------------------------------------------------------------------------------
+
+import random
+import numpy as np
+from o2_pricing import MAX_DUTY_TIME, MAX_TIME_WITHOUT_BREAK, MIN_BREAK_TIME
+
+
+def _chains(successors, bus_to_nodes):
+    # the rides of every vehicle in time order, split where the driver cannot stay on board
+    for nodes in bus_to_nodes.values():
+        chain = []
+        for ride in nodes:
+            if chain and ride not in successors[chain[-1]]:
+                yield chain
+                chain = []
+            chain.append(ride)
+        if chain:
+            yield chain
+
+
+def _fits(chain, first, start_time, end_time):
+    # how many rides of chain from first on one duty can take
+    duty_start = break_end = start_time[chain[first]]
+    count = 1
+    for k in range(first + 1, len(chain)):
+        previous, ride = chain[k - 1], chain[k]
+        if end_time[ride] - duty_start > MAX_DUTY_TIME:
+            break
+        if start_time[ride] - end_time[previous] >= MIN_BREAK_TIME:
+            break_end = start_time[ride]
+        elif end_time[ride] - break_end >= MAX_TIME_WITHOUT_BREAK:
+            break
+        count += 1
+    return count
+
+
+def chain_duties(trips, successors, bus_to_nodes, rng=None):
+    """Duties (lists of rides) that cut every chain of same-bus rides, a partition of the rides.
+
+    Every duty takes all the rides that fit, or with rng a random number of them from half of those on.
+    """
+    start_time, end_time = trips.start_time.tolist(), trips.end_time.tolist()
+    duties = []
+    for chain in _chains(successors, bus_to_nodes):
+        first = 0
+        while first < len(chain):
+            count = _fits(chain, first, start_time, end_time)
+            if rng is not None:
+                count = rng.randint((count + 1) // 2, count)
+            duties.append(chain[first:first + count])
+            first += count
+    return duties
+
+
+def initial_duties(trips, successors, bus_to_nodes, variants=0, seed=0):
+    """The greedy duties followed by the duties of variants randomized cuts, without repeats.
+
+    Returns (columns, duty): duty is the greedy partition as the column of every ride.
+    """
+    greedy = chain_duties(trips, successors, bus_to_nodes)
+    duty = np.empty(len(trips), dtype=np.int64)
+    for k, column in enumerate(greedy):
+        duty[column] = k
+
+    rng = random.Random(seed)
+    columns, seen = [], set()
+    for column in greedy + [c for _ in range(variants) for c in chain_duties(trips, successors, bus_to_nodes, rng)]:
+        if tuple(column) not in seen:
+            seen.add(tuple(column))
+            columns.append(column)
+    return columns, duty
@@ -0,0 +1,35 @@
+# -------------------------------------------------------------------------------
+# Name:        Runs of the O^2 Challenge solver inside worker processes
+#
+# o2_decompose, o2_sweep, o2_bench and o2_daemon all call run() in a directory
+# of their own with its output in a log file. call_logged does that once for
+# all of them and hands back the error of a run that fails, so one failed run
+# does not take down a pool of them.
+# -------------------------------------------------------------------------------
+
+import os
+import sys
+
+
+def call_logged(log_file, directory, function, *args, **kwargs):
+    """function(*args, **kwargs) with the working directory set to directory and its output in log_file.
+
+    A relative log_file is in directory, None keeps the current directory or output. Returns (result, None),
+    or (None, message) when function raised: the type and text of the error.
+    """
+    cwd, stdout = os.getcwd(), sys.stdout
+    log = None
+    try:
+        if directory is not None:
+            os.chdir(directory)
+        if log_file is not None:
+            log = open(log_file, "w")
+            sys.stdout = log
+        return function(*args, **kwargs), None
+    except Exception as error:
+        return None, "{0}: {1}".format(type(error).__name__, error)
+    finally:
+        sys.stdout = stdout
+        if log is not None:
+            log.close()
+        os.chdir(cwd)
@@ -1,15 +1,39 @@
-import twocars
-import onecar
+from o2_sweep import grid, run_sweep
 
-max_num_of_iter = 1000
-max_seconds_of_final = 300
 input_file_name = "large_data_csv.csv"
-max_car_num = 1
-stable = False
+# every combination of the values in these lists is solved, several at a time (see o2_sweep)
+max_num_of_iter = [1000]
+max_seconds_of_final = [300]
+max_car_num = [1]  # vehicles a driver may use in a duty, any number from 1 up
+stable = [False]
+processes = 1  # configurations solved at a time
+threads = None  # solver threads of every configuration, None shares the cores between the processes
+work_dir = "sweep"  # a directory per configuration with its solution and logs, and summary.csv
+component_processes = 0  # > 0 solves the independent parts of the timetable in that many processes (see o2_decompose)
+columns_per_iter = 1  # shifts added to the master per iteration, each starting in another bus block
+pricing_processes = 1
+dual_smoothing = 0.0  # 0 keeps the duals of the master as they are
+max_column_age = 0  # LP solves a useless column stays in the master, 0 keeps them all
+# early termination, None turns a rule off (see o2_termination)
+gap_tolerance = None  # relative gap between the master value and the lower bound
+integer_gap = None  # drivers between the master value and the lower bound, both rounded up
+tailing_off = None  # (iterations, relative improvement of the master value)
+master_backend = "cplex"  # or "highs" / "scipy" without a CPLEX license
+cache_dir = "cache"  # parsed timetables are kept here for the next runs and shared by the processes
+checkpoint_file = None  # e.g. "checkpoint.npz", the column generation is saved there every checkpoint_every iterations
+checkpoint_every = 50
+resume = False  # go on from the last checkpoint in checkpoint_file
+write_lp = False  # keep the final models as almost.lp and myfinal.lp
+deadline = None  # e.g. 600: seconds for the whole run, the MIP gets what the pricing leaves (see o2_anytime)
+warm_start = None  # randomized cuts of the bus blocks in the first columns, None: single rides only (see o2_warmstart)
 
-if max_car_num == 1:
-    output_file_name = "{0}cars".format(max_car_num)
-    onecar.run(max_num_of_iter, max_seconds_of_final, input_file_name, output_file_name, stable=stable)
-elif max_car_num == 2:
-    output_file_name = "{0}cars".format(max_car_num)
-    twocars.run(max_num_of_iter, max_seconds_of_final, input_file_name, output_file_name, stable=stable)
+options = dict(columns_per_iter=columns_per_iter, pricing_processes=pricing_processes, dual_smoothing=dual_smoothing,
+               master_backend=master_backend, max_column_age=max_column_age, gap_tolerance=gap_tolerance,
+               integer_gap=integer_gap, tailing_off=tailing_off, cache_dir=cache_dir, checkpoint_file=checkpoint_file,
+               checkpoint_every=checkpoint_every, resume=resume, write_lp=write_lp, deadline=deadline,
+               warm_start=warm_start)
+configs = grid(max_num_of_iter=max_num_of_iter, max_seconds_of_final=max_seconds_of_final,
+               max_switches=[n - 1 for n in max_car_num], stable=stable)
+
+if __name__ == "__main__":
+    run_sweep(input_file_name, configs, processes, threads, work_dir, component_processes, **options)